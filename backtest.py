@@ -0,0 +1,309 @@
+import argparse
+import decimal
+import numpy as np
+
+import bot
+from bot import TradingBot, StrategyConfig
+from price_feed import ReplayPriceSource
+
+# Параметры бэктеста
+PRICE_DECIMALS = 8  # Цены хранятся как целые числа с этим количеством знаков (точность Binance - 8 знаков)
+SEARCH_CHUNK = 4096  # Начальный размер блока при векторизованном поиске следующего события
+
+
+def load_prices(path, kind='klines'):
+    """
+    Загружает историю цен из CSV или Parquet. Возвращает (prices, times): цены float64 и время в секундах.
+    kind='klines' - свечи в формате Binance (open_time, open, high, low, close, ...), берется цена закрытия;
+    kind='trades' - сделки в формате Binance (id, price, qty, quote_qty, time, ...).
+    """
+    if kind not in ('klines', 'trades'):
+        raise ValueError(f"Неизвестный тип данных: {kind}")
+
+    if str(path).endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Для чтения Parquet установите pyarrow: pip install pyarrow")
+        table = pq.read_table(path)
+        price_column, time_column = ('close', 'open_time') if kind == 'klines' else ('price', 'time')
+        prices = table.column(price_column).to_numpy().astype(np.float64)
+        times = table.column(time_column).to_numpy().astype(np.float64)
+    else:
+        price_column, time_column = (4, 0) if kind == 'klines' else (1, 4)
+        with open(path) as f:
+            first_field = f.readline().split(',')[0]
+        # Файлы Binance бывают как с заголовком, так и без него
+        skiprows = 0 if first_field.strip().replace('.', '', 1).isdigit() else 1
+        data = np.loadtxt(path, delimiter=',', usecols=(time_column, price_column),
+                          skiprows=skiprows, dtype=np.float64, ndmin=2)
+        times, prices = data[:, 0], data[:, 1]
+
+    # Время Binance приходит в миллисекундах (или в микросекундах в новых выгрузках)
+    if times.size and times[0] > 1e14:
+        times = times / 1e6
+    else:
+        times = times / 1e3
+    return prices, times
+
+
+class BacktestResult:
+    """Результаты бэктеста: сделки по циклам и сводные показатели."""
+
+    def __init__(self, cycles, summary, orders):
+        self.cycles = cycles  # Список словарей, по одному на цикл
+        self.summary = summary  # Сводные показатели
+        self.orders = orders  # Все ордера: (index, side, quantity, price)
+
+    def print_report(self):
+        """Выводит сводку бэктеста в консоль."""
+        s = self.summary
+        print("\n" + "="*50)
+        print(f"📊 Результаты бэктеста:")
+        print(f"• Завершено циклов: {s['closed_cycles']} (незавершенных: {s['open_cycles']})")
+        print(f"• Циклов, дошедших до MAX_STEPS: {s['max_steps_cycles']}")
+        print(f"• Реализованная прибыль: {s['realized_pnl']:.2f} USDT")
+        print(f"• Нереализованная прибыль: {s['unrealized_pnl']:.2f} USDT")
+        print(f"• Максимальная просадка: {s['max_drawdown']:.2f} USDT ({s['max_drawdown_pct']:.2f}%)")
+        print(f"• Максимум вложенных средств: {s['max_capital_locked']:.2f} USDT")
+        print(f"• Требуемый капитал: {s['capital']} USDT, доходность: {s['return_pct']:.2f}%")
+        print("="*50)
+
+
+class Backtester:
+    """
+    Воспроизводит решения TradingBot.process_tick на исторических ценах.
+    Следующее событие (активация, покупка усреднения, продажа) ищется векторизованно по целочисленным ценам,
+    а расчеты в точке события выполняются теми же методами TradingBot в Decimal, что и в живой торговле.
+    """
+
+    def __init__(self, config=None, symbol_info=None, price_decimals=PRICE_DECIMALS, retry_delay=bot.RETRY_DELAY):
+        # Экземпляр бота используется только как источник правил расчета и не обращается к API
+        self.rules = TradingBot(config, price_source=ReplayPriceSource(()), symbol_info=symbol_info)
+        self.config = self.rules.config
+        self.price_decimals = price_decimals
+        self.scale = 10 ** price_decimals
+        self.retry_delay = retry_delay
+
+    def _floor_int(self, value):
+        """Целочисленный порог для условия price <= value."""
+        return int((value * self.scale).to_integral_value(rounding=decimal.ROUND_FLOOR))
+
+    def _ceil_int(self, value):
+        """Целочисленный порог для условия price >= value."""
+        return int((value * self.scale).to_integral_value(rounding=decimal.ROUND_CEILING))
+
+    def _price(self, price_int):
+        """Точная цена в Decimal по целочисленному представлению."""
+        return decimal.Decimal(int(price_int)).scaleb(-self.price_decimals)
+
+    @staticmethod
+    def _find_first(prices, start, below=None, above=None):
+        """Находит первый индекс >= start, где цена <= below или >= above. Возвращает len(prices), если таких нет."""
+        n = len(prices)
+        chunk = SEARCH_CHUNK
+        while start < n:
+            stop = min(n, start + chunk)
+            window = prices[start:stop]
+            if below is not None and above is not None:
+                mask = (window <= below) | (window >= above)
+            elif below is not None:
+                mask = window <= below
+            else:
+                mask = window >= above
+            hits = np.flatnonzero(mask)
+            if hits.size:
+                return start + int(hits[0])
+            start = stop
+            chunk *= 2 # Далекие события ищем все более крупными блоками
+        return n
+
+    def _buy_quantity(self, amount_usdt, price):
+        """Количество для покупки по правилам buy_xrp или None, если ордер не прошел бы проверки."""
+        if amount_usdt < self.rules.symbol_info['minNotional']:
+            return None
+        quantity = self.rules._quantize_quantity(amount_usdt / price)
+        if quantity < self.rules.symbol_info['minQty']:
+            return None
+        return quantity
+
+    def run(self, prices, times=None):
+        """Прогоняет стратегию по ценам. times - время тиков в секундах (по умолчанию один тик в секунду)."""
+        prices = np.asarray(prices)
+        if prices.dtype.kind == 'f':
+            prices = np.rint(prices * self.scale).astype(np.int64)
+        n = len(prices)
+        times = np.arange(n, dtype=np.float64) if times is None else np.asarray(times, dtype=np.float64)
+
+        rules = self.rules
+        config = self.config
+        commission = config.commission
+        capital = rules.required_balance
+        cash = capital  # Свободные USDT
+        holdings = decimal.Decimal('0')  # Фактический баланс монет, включая остатки прошлых циклов
+
+        cycles = []
+        orders = []
+        events = [(0, cash, holdings)]  # Моменты изменения баланса для расчета просадки
+        cycle = None
+        activated = False
+        i = 0
+
+        def start_cycle(index):
+            return {'start_index': index, 'start_time': times[index], 'entry_price': rules.entry_price,
+                    'buys': 0, 'steps': 0, 'spent': decimal.Decimal('0'), 'max_locked': decimal.Decimal('0'),
+                    'proceeds': None, 'pnl': None, 'end_index': None, 'end_time': None,
+                    'max_steps_hit': False, 'closed': False}
+
+        def retry_index(index):
+            # Неудавшийся ордер повторяется не раньше, чем через retry_delay секунд
+            return int(np.searchsorted(times, times[index] + self.retry_delay, side='left'))
+
+        while i < n:
+            if not activated:
+                i = self._find_first(prices, i, below=self._floor_int(config.start_price))
+                if i >= n:
+                    break
+                activated = True
+                rules.set_entry_price(self._price(prices[i]))
+
+            if rules.total_quantity == 0:
+                # Начальная покупка цикла на текущем тике
+                price = self._price(prices[i])
+                if rules.entry_price is None:
+                    rules.set_entry_price(price)
+                if cycle is None:
+                    cycle = start_cycle(i)
+                quantity = self._buy_quantity(config.initial_amount, price)
+                if quantity is None:
+                    i = retry_index(i)
+                    continue
+                j = i
+            else:
+                below = self._floor_int(rules.ladder[rules.current_step]['price']) \
+                    if rules.current_step < config.max_steps else None
+                above = self._ceil_int(rules.sell_target)
+                j = self._find_first(prices, i, below=below, above=above)
+                if j >= n:
+                    break
+                price = self._price(prices[j])
+                quantity = None
+                if below is not None and prices[j] <= below:
+                    quantity = self._buy_quantity(rules.next_buy_amount, price)
+                    if quantity is None:
+                        i = retry_index(j)
+                        continue
+
+            if quantity is not None:
+                # Рыночная покупка по цене тика; комиссия удерживается в покупаемой монете, как в buy_xrp
+                quote_qty = quantity * price
+                net_quantity = quantity - quantity * commission
+                first_buy = rules.total_quantity == 0
+                rules.record_buy(net_quantity, quote_qty)
+                holdings += net_quantity
+                cash -= quote_qty
+                if first_buy:
+                    rules.next_buy_amount = config.initial_amount * config.multiplier
+                    rules.current_step = 0
+                else:
+                    rules.next_buy_amount *= config.multiplier
+                    rules.current_step += 1
+                cycle['buys'] += 1
+                cycle['steps'] = rules.current_step
+                cycle['spent'] = rules.total_spent
+                cycle['max_locked'] = max(cycle['max_locked'], rules.total_spent)
+                cycle['max_steps_hit'] = rules.current_step >= config.max_steps
+                orders.append((j, 'BUY', quantity, price))
+                events.append((j, cash, holdings))
+
+            # Условие прибыли проверяется на том же тике, как в process_tick
+            if rules.check_profit_condition(price):
+                if holdings > rules.symbol_info['minQty']:
+                    quantity_to_sell = rules._quantize_quantity(holdings)
+                    proceeds = quantity_to_sell * price
+                    net_proceeds = proceeds - proceeds * commission
+                    holdings -= quantity_to_sell
+                    cash += net_proceeds
+                    cycle['proceeds'] = net_proceeds
+                    cycle['pnl'] = net_proceeds - rules.total_spent
+                    orders.append((j, 'SELL', quantity_to_sell, price))
+                    events.append((j, cash, holdings))
+                cycle['end_index'] = j
+                cycle['end_time'] = times[j]
+                cycle['closed'] = True
+                cycles.append(cycle)
+                cycle = None
+                rules.entry_price = None
+                rules.ladder = []
+                rules.sell_target = None
+                rules.current_step = 0
+                rules.total_quantity = decimal.Decimal('0')
+                rules.total_spent = decimal.Decimal('0')
+                rules.next_buy_amount = config.initial_amount
+            i = j + 1
+
+        unrealized = decimal.Decimal('0')
+        if cycle is not None:
+            if n and rules.total_quantity > 0:
+                unrealized = rules.total_quantity * self._price(prices[-1]) - rules.total_spent
+            cycle['pnl'] = unrealized
+            cycles.append(cycle)
+
+        max_drawdown = self._max_drawdown(prices, events)
+        realized = sum((c['pnl'] for c in cycles if c['closed'] and c['pnl'] is not None), decimal.Decimal('0'))
+        summary = {
+            'capital': capital,
+            'closed_cycles': sum(1 for c in cycles if c['closed']),
+            'open_cycles': sum(1 for c in cycles if not c['closed']),
+            'max_steps_cycles': sum(1 for c in cycles if c['max_steps_hit']),
+            'realized_pnl': realized,
+            'unrealized_pnl': unrealized,
+            'max_drawdown': max_drawdown,
+            'max_drawdown_pct': max_drawdown / float(capital) * 100 if capital else 0.0,
+            'max_capital_locked': max((c['max_locked'] for c in cycles), default=decimal.Decimal('0')),
+            'return_pct': float(realized / capital * 100) if capital else 0.0,
+        }
+        return BacktestResult(cycles, summary, orders)
+
+    def _max_drawdown(self, prices, events):
+        """Максимальная просадка капитала (USDT + монеты по рыночной цене) по всем тикам."""
+        n = len(prices)
+        peak = -np.inf
+        max_drawdown = 0.0
+        for k, (start, cash, holdings) in enumerate(events):
+            stop = events[k + 1][0] if k + 1 < len(events) else n
+            if stop <= start:
+                continue
+            # Между событиями баланс постоянен, капитал линейно зависит от цены
+            equity = float(cash) + float(holdings) * (prices[start:stop] / self.scale)
+            running_peak = np.maximum(np.maximum.accumulate(equity), peak)
+            max_drawdown = max(max_drawdown, float(np.max(running_peak - equity)))
+            peak = running_peak[-1]
+        return max_drawdown
+
+
+def make_symbol_info(symbol, step_size, min_qty, min_notional):
+    """Создает описание торговой пары без обращения к API (для бэктеста)."""
+    return {
+        'baseAsset': symbol[:-4],
+        'quoteAsset': symbol[-4:],
+        'minQty': decimal.Decimal(min_qty),
+        'stepSize': decimal.Decimal(step_size),
+        'minNotional': decimal.Decimal(min_notional),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бэктест DCA-стратегии на исторических данных")
+    parser.add_argument('path', help="CSV или Parquet файл со свечами или сделками Binance")
+    parser.add_argument('--kind', choices=('klines', 'trades'), default='klines')
+    parser.add_argument('--step-size', default='0.1')
+    parser.add_argument('--min-qty', default='0.1')
+    parser.add_argument('--min-notional', default='5')
+    args = parser.parse_args()
+
+    config = StrategyConfig()
+    symbol_info = make_symbol_info(config.symbol, args.step_size, args.min_qty, args.min_notional)
+    prices, times = load_prices(args.path, kind=args.kind)
+    result = Backtester(config, symbol_info).run(prices, times)
+    result.print_report()
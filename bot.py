@@ -1,8 +1,13 @@
 import os
 import time
 import decimal
+import threading
 from binance import Client
 from binance.exceptions import BinanceAPIException
+from price_feed import BinanceStreamSource
+from symbol_cache import symbol_cache
+from user_stream import UserDataStream
+from journal import StateJournal
 
 # Настройки
 API_KEY = os.getenv('BINANCE_API_KEY')
@@ -18,49 +23,115 @@ MULTIPLIER = decimal.Decimal('1.3')  # Множитель для увеличе
 MAX_STEPS = 10  # Максимальное количество шагов усреднения (после начальной покупки)
 PROFIT_PERCENT = decimal.Decimal('0.5')  # Процент прибыли для продажи от средней цены
 
+# Параметры потока цен
+PRICE_STREAM = 'trade'  # Тип потока цен: 'trade' (сделки) или 'bookTicker' (лучшие цены стакана)
+PRICE_STALE_AFTER = 10  # Секунд без тиков, после которых цена запрашивается через REST
+STATUS_INTERVAL = 3  # Как часто (в секундах) выводить состояние бота в консоль
+RETRY_DELAY = 3  # Пауза в секундах перед повторной попыткой неудавшейся покупки
+
+# Режим ордеров: 'market' - рыночная покупка при достижении уровня,
+# 'limit' - вся лестница выставляется лимитными ордерами при входе в цикл, продажа - лимитным ордером
+ORDER_MODE = 'market'
+
 # Инициализация клиента Binance (используем тестовую сеть для безопасного тестирования)
-client = Client(API_KEY, API_SECRET, testnet=True)
+# ping=False: модуль можно импортировать без сети (бэктест, тесты); связь проверяется первым запросом
+client = Client(API_KEY, API_SECRET, testnet=True, ping=False)
+
+class StrategyConfig:
+    """Параметры одного экземпляра стратегии. По умолчанию берутся из настроек выше."""
+
+    def __init__(self, symbol=SYMBOL, start_price=START_PRICE, decline_percent=DECLINE_PERCENT,
+                 initial_amount=INITIAL_AMOUNT, multiplier=MULTIPLIER, max_steps=MAX_STEPS,
+                 profit_percent=PROFIT_PERCENT, commission=COMMISSION, order_mode=ORDER_MODE):
+        if order_mode not in ('market', 'limit'):
+            raise ValueError(f"Неизвестный режим ордеров: {order_mode}")
+        self.symbol = symbol
+        self.start_price = decimal.Decimal(start_price)
+        self.decline_percent = decimal.Decimal(decline_percent)
+        self.initial_amount = decimal.Decimal(initial_amount)
+        self.multiplier = decimal.Decimal(multiplier)
+        self.max_steps = int(max_steps)
+        self.profit_percent = decimal.Decimal(profit_percent)
+        self.commission = decimal.Decimal(commission)
+        self.order_mode = order_mode
+
+
+def extract_symbol_info(exchange_info, symbol):
+    """Извлекает фильтры торговой пары (LOT_SIZE, MIN_NOTIONAL) из ответа get_exchange_info."""
+    for s in exchange_info['symbols']:
+        if s['symbol'] == symbol:
+            info = {
+                'baseAsset': s.get('baseAsset', symbol[:-4]),
+                'quoteAsset': s.get('quoteAsset', symbol[-4:]),
+                'minQty': decimal.Decimal('0'),
+                'stepSize': decimal.Decimal('0'),
+                'tickSize': decimal.Decimal('0'),
+                'minNotional': decimal.Decimal('0')
+            }
+            for f in s['filters']:
+                if f['filterType'] == 'LOT_SIZE':
+                    info['minQty'] = decimal.Decimal(f['minQty'])
+                    info['stepSize'] = decimal.Decimal(f['stepSize'])
+                elif f['filterType'] == 'PRICE_FILTER':
+                    info['tickSize'] = decimal.Decimal(f['tickSize'])
+                elif f['filterType'] in ('MIN_NOTIONAL', 'NOTIONAL'):
+                    info['minNotional'] = decimal.Decimal(f['minNotional'])
+            return info
+    return None
+
 
 class TradingBot:
-    def __init__(self):
+    def __init__(self, config=None, price_source=None, client=None, symbol_info=None, journal=None, clock=time):
+        # Параметры стратегии и клиент Binance (несколько ботов могут использовать один общий клиент)
+        self.config = config if config is not None else StrategyConfig()
+        self.client = client if client is not None else globals()['client']
+        self.clock = clock  # Источник времени (модуль time или виртуальные часы симулятора)
+
         # Переменные состояния бота
         self.entry_price = None  # Цена, по которой алгоритм был активирован (START_PRICE или ниже)
         self.current_step = 0  # Текущий шаг усреднения (0 для первого шага DCA, 1 для второго и т.д.)
         self.total_quantity = decimal.Decimal('0')  # Общее количество купленных XRP
         self.total_spent = decimal.Decimal('0')  # Общая сумма потраченных USDT
-        self.next_buy_amount = INITIAL_AMOUNT  # Сумма для следующей покупки
-        self.symbol_info = self._get_symbol_info() # Информация о торговой паре (минимальные значения, точность)
+        self.next_buy_amount = self.config.initial_amount  # Сумма для следующей покупки
+        self.ladder = []  # Предрасчитанные уровни усреднения текущего цикла (см. _build_ladder)
+        self.sell_target = None  # Целевая цена продажи, пересчитывается только после покупок
+        # Информация о торговой паре (минимальные значения, точность); может быть передана заранее
+        self.symbol_info = symbol_info if symbol_info is not None else self._get_symbol_info()
 
         # Проверка, что информация о символе получена
         if not self.symbol_info:
             print("❌ Не удалось получить информацию о символе. Проверьте SYMBOL или подключение к API.")
             exit()
 
+        self.base_asset = self.symbol_info['baseAsset']  # Покупаемый актив (XRP)
+        self.quote_asset = self.symbol_info['quoteAsset']  # Актив котировки (USDT)
         self.required_balance = self._calculate_required_balance()
-        self.active_orders = [] # Для отслеживания активных ордеров, если бы использовались лимитные ордера
+        self.active_orders = [] # Активные лимитные ордера (режим 'limit'): orderId, сторона, шаг, цена, количество
+        self.cycle_closed = False  # Цикл закрыт исполнением лимитного ордера на продажу
+        # Тики и события ордеров приходят из разных потоков, решения по ним принимаются под блокировкой
+        self.lock = threading.RLock()
+        self.journal = journal  # Журнал состояния для восстановления после сбоя (StateJournal или None)
+
+        # Источник цен: по умолчанию websocket-поток, при его молчании - REST-запрос get_current_price
+        if price_source is None:
+            price_source = BinanceStreamSource(self.config.symbol, API_KEY, API_SECRET, testnet=True, stream=PRICE_STREAM,
+                                               fallback=self.get_current_price, stale_after=PRICE_STALE_AFTER)
+        self.price_source = price_source
+        self.activated = False  # Цена активации START_PRICE была достигнута (проверяется только один раз)
+        self.retry_at = 0  # Время (clock.monotonic), раньше которого не повторяем неудавшуюся покупку
+        self.last_status_at = 0  # Время последнего вывода состояния в консоль
 
     def _get_symbol_info(self):
-        """Получает информацию о торговой паре (XRPUSDT) с Binance."""
+        """Получает информацию о торговой паре (XRPUSDT) из кэша на диске или с Binance."""
         try:
-            exchange_info = client.get_exchange_info()
-            for s in exchange_info['symbols']:
-                if s['symbol'] == SYMBOL:
-                    info = {
-                        'minQty': decimal.Decimal('0'),
-                        'stepSize': decimal.Decimal('0'),
-                        'minNotional': decimal.Decimal('0')
-                    }
-                    for f in s['filters']:
-                        if f['filterType'] == 'LOT_SIZE':
-                            info['minQty'] = decimal.Decimal(f['minQty'])
-                            info['stepSize'] = decimal.Decimal(f['stepSize'])
-                        elif f['filterType'] == 'MIN_NOTIONAL':
-                            info['minNotional'] = decimal.Decimal(f['minNotional'])
-                    return info
-            return None
+            exchange_info = symbol_cache.get(self.client, self.config.symbol)
+            return extract_symbol_info(exchange_info, self.config.symbol)
         except BinanceAPIException as e:
             print(f"❌ Ошибка получения информации о символе: {e.message}")
             return None
+        except Exception as e:
+            print(f"❌ Неизвестная ошибка при получении информации о символе: {e}")
+            return None
 
     def _quantize_quantity(self, quantity):
         """Округляет количество до ближайшего шага, разрешенного Binance."""
@@ -70,48 +141,55 @@ class TradingBot:
         # Используем quantize для округления к ближайшему шагу
         return (quantity / step_size).quantize(decimal.Decimal('1.'), rounding=decimal.ROUND_DOWN) * step_size
 
+    def _quantize_price(self, price, rounding=decimal.ROUND_DOWN):
+        """Округляет цену до шага цены (tickSize) Binance в заданную сторону."""
+        tick_size = self.symbol_info.get('tickSize')
+        if not tick_size:
+            return price
+        return (price / tick_size).quantize(decimal.Decimal('1.'), rounding=rounding) * tick_size
+
     def _calculate_required_balance(self):
         """Рассчитывает необходимый баланс USDT для выполнения всех шагов с учетом комиссий."""
-        total = INITIAL_AMOUNT * (1 + COMMISSION) # Начальная покупка
-        current_amount = INITIAL_AMOUNT
+        total = self.config.initial_amount * (1 + self.config.commission) # Начальная покупка
+        current_amount = self.config.initial_amount
 
-        for _ in range(MAX_STEPS): # Добавляем MAX_STEPS DCA покупок
-            current_amount *= MULTIPLIER
-            total += current_amount * (1 + COMMISSION)
+        for _ in range(self.config.max_steps): # Добавляем MAX_STEPS DCA покупок
+            current_amount *= self.config.multiplier
+            total += current_amount * (1 + self.config.commission)
 
         # Округляем до двух знаков после запятой
         return total.quantize(decimal.Decimal('0.00'))
 
     def get_usdt_balance(self):
-        """Получает текущий баланс USDT."""
+        """Получает текущий баланс USDT (актива котировки)."""
         try:
-            balance = client.get_asset_balance(asset='USDT')
+            balance = self.client.get_asset_balance(asset=self.quote_asset)
             return decimal.Decimal(balance['free'])
         except BinanceAPIException as e:
-            print(f"❌ Ошибка получения баланса USDT: {e.message}")
+            print(f"❌ Ошибка получения баланса {self.quote_asset}: {e.message}")
             return decimal.Decimal('0')
 
     def get_xrp_balance(self):
-        """Получает текущий баланс XRP."""
+        """Получает текущий баланс XRP (покупаемого актива)."""
         try:
-            balance = client.get_asset_balance(asset='XRP')
+            balance = self.client.get_asset_balance(asset=self.base_asset)
             return decimal.Decimal(balance['free'])
         except BinanceAPIException as e:
-            print(f"❌ Ошибка получения баланса XRP: {e.message}")
+            print(f"❌ Ошибка получения баланса {self.base_asset}: {e.message}")
             return decimal.Decimal('0')
 
     def confirm_start(self):
         """Подтверждение запуска бота с проверкой баланса."""
         print("\n" + "="*50)
         print(f"📊 Параметры стратегии:")
-        print(f"• Торговая пара: {SYMBOL}")
-        print(f"• Цена активации: {START_PRICE} USDT")
-        print(f"• Процент падения для покупки: {DECLINE_PERCENT}%")
-        print(f"• Начальная сумма покупки: {INITIAL_AMOUNT} USDT")
-        print(f"• Множитель суммы покупки: {MULTIPLIER}")
-        print(f"• Максимальное количество шагов усреднения: {MAX_STEPS}")
-        print(f"• Цель прибыли: {PROFIT_PERCENT}%")
-        print(f"• Комиссия Binance: {COMMISSION*100}%")
+        print(f"• Торговая пара: {self.config.symbol}")
+        print(f"• Цена активации: {self.config.start_price} USDT")
+        print(f"• Процент падения для покупки: {self.config.decline_percent}%")
+        print(f"• Начальная сумма покупки: {self.config.initial_amount} USDT")
+        print(f"• Множитель суммы покупки: {self.config.multiplier}")
+        print(f"• Максимальное количество шагов усреднения: {self.config.max_steps}")
+        print(f"• Цель прибыли: {self.config.profit_percent}%")
+        print(f"• Комиссия Binance: {self.config.commission*100}%")
         print(f"• Требуемый баланс для всех шагов: {self.required_balance} USDT")
 
         balance = self.get_usdt_balance()
@@ -123,8 +201,8 @@ class TradingBot:
             # Можно добавить опцию продолжить с меньшим количеством шагов или выйти
 
         # Добавлена проверка на минимальный размер ордера
-        if INITIAL_AMOUNT < self.symbol_info['minNotional']:
-            print(f"\n❌ Ошибка: Начальная сумма покупки ({INITIAL_AMOUNT:.2f} USDT) ниже минимального размера ордера Binance ({self.symbol_info['minNotional']:.2f} USDT).")
+        if self.config.initial_amount < self.symbol_info['minNotional']:
+            print(f"\n❌ Ошибка: Начальная сумма покупки ({self.config.initial_amount:.2f} USDT) ниже минимального размера ордера Binance ({self.symbol_info['minNotional']:.2f} USDT).")
             print("Пожалуйста, увеличьте INITIAL_AMOUNT в настройках бота.")
             exit()
 
@@ -137,7 +215,7 @@ class TradingBot:
     def get_current_price(self):
         """Получает текущую рыночную цену XRP."""
         try:
-            ticker = client.get_symbol_ticker(symbol=SYMBOL)
+            ticker = self.client.get_symbol_ticker(symbol=self.config.symbol)
             return decimal.Decimal(ticker['price'])
         except BinanceAPIException as e:
             print(f"❌ Ошибка получения текущей цены: {e.message}")
@@ -146,22 +224,18 @@ class TradingBot:
             print(f"❌ Неизвестная ошибка при получении цены: {e}")
             return None
 
-    def wait_for_start_price(self):
-        """Ожидает, пока текущая цена достигнет или опустится ниже START_PRICE."""
-        print(f"🕒 Ожидаем цену активации {START_PRICE} USDT...")
-        while True:
-            price = self.get_current_price()
-            if price is None:
-                time.sleep(3) # Ждем перед повторной попыткой
-                continue
-
+    def check_start_price(self, price):
+        """Проверяет тик на условие активации и фиксирует entry_price при достижении START_PRICE."""
+        # Активируем бота, когда цена достигает или опускается ниже START_PRICE
+        if price <= self.config.start_price:
+            print(f"✅ Цена достигла {price:.4f} USDT, активируем бота!")
+            self.set_entry_price(price) # Фиксируем цену активации как entry_price
+            self.activated = True
+            self.save_state('activated')
+            return True
+        if self._status_due():
             print(f" Текущая цена: {price:.4f} USDT")
-            # Активируем бота, когда цена достигает или опускается ниже START_PRICE
-            if price <= START_PRICE:
-                print(f"✅ Цена достигла {price:.4f} USDT, активируем бота!")
-                self.entry_price = price # Фиксируем цену активации как entry_price
-                return
-            time.sleep(3) # Проверяем цену каждые 3 секунды
+        return False
 
     def calculate_target_price(self, step):
         """
@@ -171,12 +245,42 @@ class TradingBot:
         # Целевая цена - это entry_price, уменьшенная на DECLINE_PERCENT для каждого шага усреднения.
         # Например, для step=0 (первое усреднение) падение будет на 1 * DECLINE_PERCENT
         # Для step=1 (второе усреднение) падение будет на 2 * DECLINE_PERCENT
-        return self.entry_price * (1 - DECLINE_PERCENT/decimal.Decimal('100') * (step + 1))
+        return self.entry_price * (1 - self.config.decline_percent/decimal.Decimal('100') * (step + 1))
+
+    def _build_ladder(self):
+        """
+        Предрасчитывает лестницу усреднения для текущего entry_price: для каждого шага
+        целевую цену, сумму покупки в USDT и округленное количество по целевой цене.
+        """
+        ladder = []
+        amount = self.config.initial_amount
+        for step in range(self.config.max_steps):
+            amount *= self.config.multiplier
+            price = self.calculate_target_price(step)
+            ladder.append({'price': price, 'amount': amount, 'quantity': self._quantize_quantity(amount / price)})
+        return ladder
+
+    def set_entry_price(self, price):
+        """Фиксирует цену входа цикла и один раз рассчитывает лестницу усреднения."""
+        self.entry_price = price
+        self.ladder = self._build_ladder()
+
+    def record_buy(self, quantity, quote_qty):
+        """Учитывает исполненную покупку и пересчитывает целевую цену продажи."""
+        self.total_quantity += quantity
+        self.total_spent += quote_qty
+        self.sell_target = self.target_sell_price()
+
+    def target_sell_price(self):
+        """Рассчитывает целевую цену продажи: средняя цена покупки + PROFIT_PERCENT."""
+        avg_price = self.total_spent / self.total_quantity
+        return avg_price * (1 + self.config.profit_percent/decimal.Decimal('100'))
 
-    def buy_xrp(self, amount_usdt):
-        """Покупает XRP на указанную сумму в USDT."""
+    def buy_xrp(self, amount_usdt, current_price=None):
+        """Покупает XRP на указанную сумму в USDT. Если цена тика не передана, она запрашивается через REST."""
         try:
-            current_price = self.get_current_price()
+            if current_price is None:
+                current_price = self.get_current_price()
             if not current_price:
                 print("❌ Не удалось получить текущую цену для покупки.")
                 return False
@@ -193,14 +297,14 @@ class TradingBot:
 
             # Проверяем минимальное количество
             if quantity_to_buy < self.symbol_info['minQty']:
-                print(f"⚠️ Рассчитанное количество {quantity_to_buy:.4f} XRP ниже минимального {self.symbol_info['minQty']:.4f} XRP. Отмена покупки.")
+                print(f"⚠️ Рассчитанное количество {quantity_to_buy:.4f} {self.base_asset} ниже минимального {self.symbol_info['minQty']:.4f} {self.base_asset}. Отмена покупки.")
                 return False # Возвращаем False
 
-            print(f"\n🛒 Покупаем {quantity_to_buy:.4f} XRP на сумму {amount_usdt:.2f} USDT по цене {current_price:.4f}")
+            print(f"\n🛒 Покупаем {quantity_to_buy:.4f} {self.base_asset} на сумму {amount_usdt:.2f} USDT по цене {current_price:.4f}")
 
             # Размещаем рыночный ордер на покупку
-            order = client.create_order(
-                symbol=SYMBOL,
+            order = self.client.create_order(
+                symbol=self.config.symbol,
                 side=Client.SIDE_BUY,
                 type=Client.ORDER_TYPE_MARKET,
                 quantity=quantity_to_buy # Отправляем округленное количество
@@ -211,14 +315,14 @@ class TradingBot:
             cummulative_quote_qty = decimal.Decimal(order['cummulativeQuoteQty']) # Общая сумма в USDT, включая комиссию
 
             # Комиссия в XRP (для покупки XRP/USDT, комиссия обычно в XRP)
-            commission_xrp = executed_qty * COMMISSION
+            commission_xrp = executed_qty * self.config.commission
             net_received_xrp = executed_qty - commission_xrp
 
-            self.total_quantity += net_received_xrp
-            self.total_spent += cummulative_quote_qty # Общая сумма, которую мы фактически потратили в USDT
+            self.record_buy(net_received_xrp, cummulative_quote_qty) # cummulative_quote_qty - сумма, фактически потраченная в USDT
+            self.record_fill(order.get('orderId'), Client.SIDE_BUY, executed_qty, cummulative_quote_qty)
 
-            print(f"✅ Куплено {net_received_xrp:.4f} XRP за {cummulative_quote_qty:.2f} USDT")
-            print(f"💸 Удержано комиссии: {commission_xrp:.4f} XRP")
+            print(f"✅ Куплено {net_received_xrp:.4f} {self.base_asset} за {cummulative_quote_qty:.2f} USDT")
+            print(f"💸 Удержано комиссии: {commission_xrp:.4f} {self.base_asset}")
             return True
 
         except BinanceAPIException as e:
@@ -237,16 +341,16 @@ class TradingBot:
             free_xrp = self.get_xrp_balance()
             # Проверяем, есть ли что продавать и соответствует ли минимальному количеству
             if free_xrp <= self.symbol_info['minQty']:
-                print(f"ℹ️ Нет достаточного количества XRP для продажи ({free_xrp:.4f} <= {self.symbol_info['minQty']:.4f}).")
+                print(f"ℹ️ Нет достаточного количества {self.base_asset} для продажи ({free_xrp:.4f} <= {self.symbol_info['minQty']:.4f}).")
                 self.reset_state() # Сбросить состояние, если нет монет для продажи
-                return
+                return True
 
             # Округляем количество XRP для продажи
             quantity_to_sell = self._quantize_quantity(free_xrp)
 
-            print(f"\n💰 Продаем {quantity_to_sell:.4f} XRP...")
-            order = client.create_order(
-                symbol=SYMBOL,
+            print(f"\n💰 Продаем {quantity_to_sell:.4f} {self.base_asset}...")
+            order = self.client.create_order(
+                symbol=self.config.symbol,
                 side=Client.SIDE_SELL,
                 type=Client.ORDER_TYPE_MARKET,
                 quantity=quantity_to_sell
@@ -256,142 +360,413 @@ class TradingBot:
             cummulative_quote_qty = decimal.Decimal(order['cummulativeQuoteQty']) # Полученная сумма в USDT
 
             # Комиссия в USDT (для продажи XRP/USDT, комиссия обычно в USDT)
-            commission_usdt = cummulative_quote_qty * COMMISSION
+            commission_usdt = cummulative_quote_qty * self.config.commission
             net_received_usdt = cummulative_quote_qty - commission_usdt
 
-            print(f"✅ Продано {executed_qty:.4f} XRP, получено {net_received_usdt:.2f} USDT")
+            print(f"✅ Продано {executed_qty:.4f} {self.base_asset}, получено {net_received_usdt:.2f} USDT")
             print(f"� Удержано комиссии: {commission_usdt:.4f} USDT")
+            self.record_fill(order.get('orderId'), Client.SIDE_SELL, executed_qty, cummulative_quote_qty)
             self.reset_state() # Сброс состояния после успешной продажи
+            return True
 
         except BinanceAPIException as e:
             print(f"❌ Ошибка продажи: {e.message} (Код: {e.code})")
-            return
+            return False
         except Exception as e:
             print(f"❌ Неизвестная ошибка при выполнении продажи: {e}")
-            return
+            return False
+
+    def place_limit_order(self, side, quantity, price, step=None):
+        """Выставляет лимитный ордер GTC и добавляет его в active_orders."""
+        try:
+            order = self.client.create_order(
+                symbol=self.config.symbol,
+                side=side,
+                type=Client.ORDER_TYPE_LIMIT,
+                timeInForce=Client.TIME_IN_FORCE_GTC,
+                quantity=quantity,
+                price=format(price, 'f')
+            )
+        except BinanceAPIException as e:
+            print(f"❌ Ошибка размещения лимитного ордера: {e.message} (Код: {e.code})")
+            return None
+        except Exception as e:
+            print(f"❌ Неизвестная ошибка при размещении лимитного ордера: {e}")
+            return None
+
+        active_order = {'orderId': order['orderId'], 'side': side, 'step': step, 'price': price, 'quantity': quantity}
+        self.active_orders.append(active_order)
+        self.save_state('order_placed') # Сразу фиксируем ордер, чтобы после сбоя он не остался неизвестным
+        return active_order
+
+    def cancel_order(self, active_order):
+        """Отменяет лимитный ордер и убирает его из active_orders."""
+        if active_order in self.active_orders:
+            self.active_orders.remove(active_order)
+        try:
+            self.client.cancel_order(symbol=self.config.symbol, orderId=active_order['orderId'])
+            self.save_state('order_canceled')
+            return True
+        except BinanceAPIException as e:
+            # -2011: ордер уже исполнен или отменен
+            print(f"⚠️ Не удалось отменить ордер {active_order['orderId']}: {e.message} (Код: {e.code})")
+            return False
 
-    def check_profit_condition(self):
-        """Проверяет условие для фиксации прибыли."""
+    def cancel_active_orders(self):
+        """Отменяет все активные лимитные ордера бота."""
+        for active_order in list(self.active_orders):
+            self.cancel_order(active_order)
+
+    def place_limit_ladder(self):
+        """Выставляет оставшиеся шаги лестницы усреднения лимитными ордерами на покупку."""
+        placed = 0
+        for step in range(self.current_step, self.config.max_steps):
+            level = self.ladder[step]
+            price = self._quantize_price(level['price'], decimal.ROUND_DOWN)
+            quantity = self._quantize_quantity(level['amount'] / price)
+            if level['amount'] < self.symbol_info['minNotional'] or quantity < self.symbol_info['minQty']:
+                print(f"⚠️ Шаг {step + 1}: ордер {quantity:.4f} {self.base_asset} по {price} ниже минимальных значений Binance. Пропускаем.")
+                continue
+            if self.place_limit_order(Client.SIDE_BUY, quantity, price, step):
+                placed += 1
+        print(f"📋 Выставлено лимитных ордеров на покупку: {placed} из {self.config.max_steps - self.current_step}")
+
+    def place_take_profit(self):
+        """(Пере)выставляет лимитный ордер на продажу всего объема по текущей целевой цене."""
+        for active_order in [o for o in self.active_orders if o['side'] == Client.SIDE_SELL]:
+            self.cancel_order(active_order)
+
+        quantity = self._quantize_quantity(self.get_xrp_balance())
+        if quantity < self.symbol_info['minQty']:
+            print(f"ℹ️ Недостаточно {self.base_asset} для ордера на продажу ({quantity:.4f}).")
+            return None
+        price = self._quantize_price(self.sell_target, decimal.ROUND_UP)
+        print(f"🎯 Лимитный ордер на продажу: {quantity:.4f} {self.base_asset} по {price} USDT")
+        return self.place_limit_order(Client.SIDE_SELL, quantity, price)
+
+    def on_order_update(self, event):
+        """Обрабатывает событие executionReport из потока пользовательских данных Binance."""
+        if event.get('e') != 'executionReport' or event.get('s') != self.config.symbol:
+            return
+        with self.lock:
+            active_order = next((o for o in self.active_orders if o['orderId'] == event['i']), None)
+            if active_order is None:
+                return # Ордер не наш или уже отменен нами
+
+            status = event['X']
+            if event['x'] == 'TRADE':
+                quantity = decimal.Decimal(event['l'])
+                price = decimal.Decimal(event['L'])
+                self.record_fill(event['i'], active_order['side'], quantity, quantity * price)
+                if active_order['side'] == Client.SIDE_BUY:
+                    commission = decimal.Decimal(event['n']) if event['N'] == self.base_asset else decimal.Decimal('0')
+                    self.record_buy(quantity - commission, quantity * price)
+                    print(f"✅ Исполнен лимитный ордер шага {active_order['step'] + 1}: {quantity:.4f} {self.base_asset} по {price:.4f}")
+                    if status == 'FILLED':
+                        self.active_orders.remove(active_order)
+                        self.next_buy_amount *= self.config.multiplier
+                        self.current_step += 1
+                        if self.current_step == self.config.max_steps:
+                            print("\n⚠️ Достигнут максимум шагов усреднения. Ожидаем условия для продажи...")
+                    self.save_state('limit_buy_filled')
+                    # Средняя цена изменилась - переставляем ордер на продажу
+                    self.place_take_profit()
+                elif status == 'FILLED':
+                    print(f"\n🎯 Исполнен ордер на продажу: {decimal.Decimal(event['z']):.4f} {self.base_asset}, получено {decimal.Decimal(event['Z']):.2f} USDT")
+                    self.active_orders.remove(active_order)
+                    self.cancel_active_orders() # Оставшиеся ступени лестницы больше не нужны
+                    self.reset_state()
+                    self.cycle_closed = True
+            elif status in ('CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH'):
+                print(f"⚠️ Ордер {event['i']} снят биржей (статус {status}).")
+                self.active_orders.remove(active_order)
+                self.save_state('order_removed')
+
+    def check_profit_condition(self, current_price=None):
+        """Проверяет условие для фиксации прибыли по цене тика (или по REST-цене, если тик не передан)."""
         if self.total_quantity == 0:
             return False # Нет купленных монет, нет прибыли
 
-        avg_price = self.total_spent / self.total_quantity
-        current_price = self.get_current_price()
+        if current_price is None:
+            current_price = self.get_current_price()
         if not current_price:
             return False
 
-        # Целевая цена продажи: средняя цена + PROFIT_PERCENT
-        target_sell_price = avg_price * (1 + PROFIT_PERCENT/decimal.Decimal('100'))
-        
-        print(f"📈 Средняя цена покупки: {avg_price:.4f} USDT")
-        print(f"🎯 Целевая цена продажи: {target_sell_price:.4f} USDT")
-        print(f"💰 Текущая цена: {current_price:.4f} USDT")
-
-        return current_price >= target_sell_price
+        # Целевая цена продажи: средняя цена + PROFIT_PERCENT (рассчитана при последней покупке)
+        if self.sell_target is None:
+            self.sell_target = self.target_sell_price()
+        return current_price >= self.sell_target
 
     def reset_state(self):
         """Сбрасывает состояние бота для нового цикла торговли."""
         self.entry_price = None
+        self.ladder = []
+        self.sell_target = None
         self.current_step = 0
         self.total_quantity = decimal.Decimal('0')
         self.total_spent = decimal.Decimal('0')
-        self.next_buy_amount = INITIAL_AMOUNT
+        self.next_buy_amount = self.config.initial_amount
+        self.save_state('reset')
         print("\n♻️ Состояние бота сброшено. Ожидаем нового цикла.")
 
-    def run(self):
-        """Основной цикл работы бота."""
-        # wait_for_start_price() вызывается только один раз при первом запуске
-        # self.entry_price устанавливается здесь на фактическую цену активации
+    def export_state(self):
+        """Возвращает состояние цикла в виде, пригодном для записи в журнал (JSON)."""
+        return {
+            'symbol': self.config.symbol,
+            'activated': self.activated,
+            'entry_price': str(self.entry_price) if self.entry_price is not None else None,
+            'current_step': self.current_step,
+            'total_quantity': str(self.total_quantity),
+            'total_spent': str(self.total_spent),
+            'next_buy_amount': str(self.next_buy_amount),
+            'active_orders': [{'orderId': o['orderId'], 'side': o['side'], 'step': o['step'],
+                               'price': str(o['price']), 'quantity': str(o['quantity'])} for o in self.active_orders],
+        }
+
+    def restore_state(self, state):
+        """Восстанавливает состояние цикла из записи журнала."""
+        self.activated = state['activated']
+        self.current_step = state['current_step']
+        self.total_quantity = decimal.Decimal(state['total_quantity'])
+        self.total_spent = decimal.Decimal(state['total_spent'])
+        self.next_buy_amount = decimal.Decimal(state['next_buy_amount'])
+        if state['entry_price'] is not None:
+            self.set_entry_price(decimal.Decimal(state['entry_price']))
+        else:
+            self.entry_price = None
+            self.ladder = []
+        self.sell_target = self.target_sell_price() if self.total_quantity > 0 else None
+        self.active_orders = [{'orderId': o['orderId'], 'side': o['side'], 'step': o['step'],
+                               'price': decimal.Decimal(o['price']), 'quantity': decimal.Decimal(o['quantity'])}
+                              for o in state['active_orders']]
+
+    def save_state(self, event):
+        """Записывает текущее состояние в журнал (если журнал подключен)."""
+        if self.journal is not None:
+            self.journal.record_state(self.export_state(), event)
+
+    def record_fill(self, order_id, side, quantity, quote_qty):
+        """Записывает исполнение ордера в журнал (если журнал подключен)."""
+        if self.journal is not None:
+            self.journal.record_fill(order_id=order_id, side=side, quantity=str(quantity), quote_qty=str(quote_qty))
+
+    def restore_from_journal(self):
+        """Восстанавливает состояние из журнала. Возвращает True, если сохраненное состояние найдено."""
+        if self.journal is None:
+            return False
+        state = self.journal.load()
+        if state is None:
+            return False
+        self.restore_state(state)
+        print(f"📂 Состояние восстановлено из журнала: шаг {self.current_step}, {self.total_quantity:.4f} {self.base_asset}, потрачено {self.total_spent:.2f} USDT")
+        return True
+
+    def _get_total_balance(self, asset):
+        """Полный баланс актива на бирже: свободный + заблокированный в ордерах."""
+        balance = self.client.get_asset_balance(asset=asset)
+        return decimal.Decimal(balance['free']) + decimal.Decimal(balance.get('locked', '0'))
+
+    def reconcile(self):
+        """
+        Сверяет восстановленное состояние с биржей: учитывает ордера, исполненные или снятые,
+        пока бот не работал, и проверяет, что монеты позиции все еще на балансе.
+        """
+        print("🔎 Сверяем восстановленное состояние с биржей...")
+        try:
+            if self.active_orders:
+                open_ids = {o['orderId'] for o in self.client.get_open_orders(symbol=self.config.symbol)}
+                for active_order in list(self.active_orders):
+                    if active_order['orderId'] in open_ids:
+                        continue
+                    self.active_orders.remove(active_order)
+                    order = self.client.get_order(symbol=self.config.symbol, orderId=active_order['orderId'])
+                    executed_qty = decimal.Decimal(order['executedQty'])
+                    if executed_qty == 0:
+                        print(f"ℹ️ Ордер {active_order['orderId']} был снят без исполнения.")
+                        continue
+                    quote_qty = decimal.Decimal(order['cummulativeQuoteQty'])
+                    self.record_fill(active_order['orderId'], active_order['side'], executed_qty, quote_qty)
+                    if active_order['side'] == Client.SIDE_BUY:
+                        print(f"✅ Пока бот не работал, исполнен ордер шага {active_order['step'] + 1}: {executed_qty:.4f} {self.base_asset}")
+                        self.record_buy(executed_qty - executed_qty * self.config.commission, quote_qty)
+                        if order['status'] == 'FILLED':
+                            self.next_buy_amount *= self.config.multiplier
+                            self.current_step += 1
+                    elif order['status'] == 'FILLED':
+                        print(f"🎯 Пока бот не работал, исполнен ордер на продажу: {executed_qty:.4f} {self.base_asset}")
+                        self.cancel_active_orders()
+                        self.reset_state()
+                        return True
+
+            if self.total_quantity > 0:
+                balance = self._get_total_balance(self.base_asset)
+                if balance < self.symbol_info['minQty']:
+                    print(f"⚠️ На балансе нет {self.base_asset} позиции (закрыта вне бота). Начинаем новый цикл.")
+                    self.cancel_active_orders()
+                    self.reset_state()
+                    return True
+                if balance < self.total_quantity:
+                    # Часть монет продана вне бота - уменьшаем позицию, сохраняя среднюю цену
+                    print(f"⚠️ На балансе {balance:.4f} {self.base_asset}, а по журналу {self.total_quantity:.4f}. Корректируем позицию.")
+                    self.total_spent = self.total_spent * balance / self.total_quantity
+                    self.total_quantity = balance
+                    self.sell_target = self.target_sell_price()
+
+            if self.config.order_mode == 'limit' and self.total_quantity > 0:
+                self.place_take_profit() # Средняя цена могла измениться, пока бот не работал
+        except BinanceAPIException as e:
+            print(f"❌ Ошибка сверки состояния с биржей: {e.message} (Код: {e.code})")
+            return False
 
-        # --- Выполняем начальную покупку по цене активации ---
+        self.save_state('reconciled')
+        print("✅ Состояние сверено с биржей.")
+        return True
+
+    def _status_due(self):
+        """Разрешает вывод состояния не чаще раза в STATUS_INTERVAL секунд, чтобы не печатать каждый тик."""
+        now = self.clock.monotonic()
+        if now - self.last_status_at >= STATUS_INTERVAL:
+            self.last_status_at = now
+            return True
+        return False
+
+    def print_status(self, current_price, target_buy_price=None):
+        """Выводит текущее состояние цикла усреднения."""
+        if target_buy_price is not None:
+            print(f"\n--- Шаг усреднения {self.current_step + 1}/{self.config.max_steps} ---")
+        print(f"Текущая цена: {current_price:.4f} USDT")
+        if target_buy_price is not None:
+            print(f"Целевая цена для покупки: {target_buy_price:.4f} USDT (падение на {self.config.decline_percent * (self.current_step + 1)}% от {self.entry_price:.4f})")
+            print(f"Сумма для следующей покупки: {self.next_buy_amount:.2f} USDT")
+        print(f"Всего потрачено: {self.total_spent:.2f} USDT")
+        print(f"Всего {self.base_asset}: {self.total_quantity:.4f}")
+
+        # Добавление вывода средней цены покупки и целевой цены продажи
+        if self.total_quantity > 0:
+            avg_price = self.total_spent / self.total_quantity
+            print(f"📊 Средняя цена всех покупок: {avg_price:.4f} USDT")
+            print(f"🎯 Целевая цена продажи для усреднения: {self.sell_target:.4f} USDT")
+        else:
+            print(f"📊 Средняя цена покупок: Пока нет купленных {self.base_asset}.")
+            print("🎯 Целевая цена продажи: N/A")
+
+        if target_buy_price is not None:
+            print(f"Ожидаем падения цены до {target_buy_price:.4f} USDT для усреднения...")
+
+    def enter_cycle(self, current_price):
+        """Выполняет начальную покупку цикла по цене текущего тика."""
         print(f"\n--- Выполняем первую покупку (начальный вход) ---")
-        current_price = self.get_current_price()
-        if current_price is None:
-            print("❌ Не удалось получить текущую цену для первой покупки. Перезапуск бота.")
-            self.reset_state() # Сброс состояния для нового цикла
-            return
+        if self.entry_price is None:
+            # Активация по START_PRICE происходит один раз; следующие циклы начинаются от текущей цены
+            self.set_entry_price(current_price)
 
         # Первая покупка всегда на сумму INITIAL_AMOUNT
-        print(f"🛒 Покупаем {INITIAL_AMOUNT:.2f} USDT XRP по текущей цене {current_price:.4f}")
-        if self.buy_xrp(INITIAL_AMOUNT):
+        print(f"🛒 Покупаем {self.config.initial_amount:.2f} USDT {self.base_asset} по текущей цене {current_price:.4f}")
+        if self.buy_xrp(self.config.initial_amount, current_price):
             # После успешной начальной покупки, устанавливаем next_buy_amount для первого шага DCA
-            self.next_buy_amount = INITIAL_AMOUNT * MULTIPLIER
+            self.next_buy_amount = self.config.initial_amount * self.config.multiplier
             self.current_step = 0 # Это 0-й шаг усреднения (первое падение после начальной покупки)
-            # Проверяем условие прибыли сразу после начальной покупки (маловероятно, но возможно)
-            if self.check_profit_condition():
-                print(f"\n🎯 Условие прибыли достигнуто сразу после начальной покупки! Продаем все XRP.")
-                self.sell_all_xrp()
-                return
-        else:
-            print("⚠️ Начальная покупка не удалась. Перезапуск бота.")
-            self.reset_state()
-            return # Если начальная покупка не удалась, перезапускаем бот
-
-        # --- Продолжаем с MAX_STEPS шагами усреднения ---
-        # Цикл теперь итерируется от current_step 0 до MAX_STEPS-1,
-        # представляя 1-ю, 2-ю, ..., MAX_STEPS-ю покупки усреднения.
-        # Общее количество покупок будет 1 (начальная) + MAX_STEPS (усреднение).
-        while self.current_step < MAX_STEPS:
-            current_price = self.get_current_price()
-            if current_price is None:
-                time.sleep(3)
-                continue
+            self.save_state('entry')
+            return True
 
-            # calculate_target_price(self.current_step) корректно рассчитает
-            # цель для 1-го падения (когда self.current_step=0), 2-го падения (self.current_step=1) и т.д.
-            target_buy_price = self.calculate_target_price(self.current_step)
+        print(f"⚠️ Начальная покупка не удалась. Повторная попытка через {RETRY_DELAY} сек.")
+        self.retry_at = self.clock.monotonic() + RETRY_DELAY
+        return False
 
-            print(f"\n--- Шаг усреднения {self.current_step + 1}/{MAX_STEPS} ---")
-            print(f"Текущая цена: {current_price:.4f} USDT")
-            print(f"Целевая цена для покупки: {target_buy_price:.4f} USDT (падение на {DECLINE_PERCENT * (self.current_step + 1)}% от {self.entry_price:.4f})")
-            print(f"Сумма для следующей покупки: {self.next_buy_amount:.2f} USDT")
-            print(f"Всего потрачено: {self.total_spent:.2f} USDT")
-            print(f"Всего XRP: {self.total_quantity:.4f}")
+    def process_tick(self, current_price):
+        """
+        Принимает торговое решение по одному тику цены.
+        Проверяет активацию по START_PRICE, выполняет начальную и усредняющие покупки,
+        проверяет условие прибыли. Возвращает True, когда цикл завершён продажей.
+        """
+        with self.lock:
+            return self._process_tick(current_price)
 
-            # Добавление вывода средней цены покупки и целевой цены продажи
-            if self.total_quantity > 0:
-                avg_price = self.total_spent / self.total_quantity
-                target_sell_price_for_display = avg_price * (1 + PROFIT_PERCENT/decimal.Decimal('100'))
-                print(f"📊 Средняя цена всех покупок: {avg_price:.4f} USDT")
-                print(f"🎯 Целевая цена продажи для усреднения: {target_sell_price_for_display:.4f} USDT")
-            else:
-                print("📊 Средняя цена покупок: Пока нет купленных XRP.")
-                print("🎯 Целевая цена продажи: N/A")
+    def _process_tick(self, current_price):
+        if self.cycle_closed:
+            # Цикл закрыт исполнением лимитного ордера на продажу (см. on_order_update)
+            self.cycle_closed = False
+            return True
 
+        if not self.activated and not self.check_start_price(current_price):
+            return False
+
+        if self.clock.monotonic() < self.retry_at:
+            return False # Ждём перед повторной попыткой после неудачного ордера
+
+        if self.total_quantity == 0:
+            if not self.enter_cycle(current_price):
+                return False
+            if self.config.order_mode == 'limit':
+                self.place_limit_ladder()
+                self.place_take_profit()
+                return False
+        elif self.config.order_mode == 'limit':
+            # Покупки и продажа исполняются лимитными ордерами на бирже; тики нужны только для вывода состояния
+            if self._status_due():
+                target_buy_price = self.ladder[self.current_step]['price'] if self.current_step < self.config.max_steps else None
+                self.print_status(current_price, target_buy_price)
+            return False
+        elif self.current_step < self.config.max_steps:
+            # Цель для 1-го падения (когда self.current_step=0), 2-го падения (self.current_step=1) и т.д.
+            # берется из лестницы, рассчитанной при входе в цикл
+            target_buy_price = self.ladder[self.current_step]['price']
+            if self._status_due():
+                self.print_status(current_price, target_buy_price)
 
             # Проверка условия для покупки усреднения
             if current_price <= target_buy_price:
                 print(f"✅ Цена {current_price:.4f} достигла или опустилась ниже целевой {target_buy_price:.4f}. Выполняем усредняющую покупку!")
-                if self.buy_xrp(self.next_buy_amount):
-                    self.next_buy_amount *= MULTIPLIER
+                if self.buy_xrp(self.next_buy_amount, current_price):
+                    self.next_buy_amount *= self.config.multiplier
                     self.current_step += 1
-                    # После каждой покупки проверяем условие прибыли
-                    if self.check_profit_condition():
-                        print(f"\n🎯 Условие прибыли достигнуто! Продаем все XRP.")
-                        self.sell_all_xrp()
-                        return # Завершаем текущий цикл run(), чтобы начать новый
+                    self.save_state('step')
+                    if self.current_step == self.config.max_steps:
+                        print("\n⚠️ Достигнут максимум шагов усреднения. Ожидаем условия для продажи...")
                 else:
                     # Если покупка не удалась, не увеличиваем шаг и не меняем сумму
                     print("⚠️ Усредняющая покупка не удалась. Повторная попытка на этом же шаге.")
-            else:
-                print(f"Ожидаем падения цены до {target_buy_price:.4f} USDT для усреднения...")
-
-            time.sleep(3) # Пауза перед следующей проверкой цены
+                    self.retry_at = self.clock.monotonic() + RETRY_DELAY
+                    return False
+        elif self._status_due():
+            # Все шаги пройдены, бот ждет только условия для продажи
+            self.print_status(current_price)
+
+        # Условие прибыли проверяется на каждом тике
+        if self.check_profit_condition(current_price):
+            print(f"\n🎯 Условие прибыли достигнуто! Продаем все {self.base_asset}.")
+            if self.sell_all_xrp():
+                return True
+            self.retry_at = self.clock.monotonic() + RETRY_DELAY
+        return False
 
-        print("\n⚠️ Достигнут максимум шагов усреднения. Ожидаем условия для продажи...")
-        # Если все шаги пройдены, бот ждет только условия для продажи
-        while True:
-            if self.check_profit_condition():
-                print(f"\n🎯 Условие прибыли достигнуто! Продаем все XRP.")
-                self.sell_all_xrp()
-                break # Выход из цикла ожидания продажи
-            time.sleep(5) # Ждем дольше, если все шаги выполнены
+    def run(self):
+        """Основной цикл работы бота: обрабатывает тики потока цен, пока цикл не завершится продажей."""
+        # Ожидание цены активации происходит только один раз, при первом запуске;
+        # каждый тик обрабатывается сразу после поступления, без опроса REST с паузами
+        if not self.activated:
+            print(f"🕒 Ожидаем цену активации {self.config.start_price} USDT...")
+        for current_price in self.price_source.ticks():
+            if self.process_tick(current_price):
+                return
 
 if __name__ == "__main__":
-    bot = TradingBot()
-    # Запрос подтверждения только при первом запуске скрипта
-    bot.confirm_start()
-    bot.wait_for_start_price() # Ожидание цены активации также происходит только один раз
+    journal = StateJournal(SYMBOL)
+    bot = TradingBot(journal=journal)
+    # После перезапуска восстанавливаем состояние цикла из журнала и сверяем его с биржей
+    if bot.restore_from_journal():
+        bot.reconcile()
+    if bot.total_quantity > 0:
+        print("▶️ Продолжаем незавершенный цикл без повторного подтверждения.")
+    else:
+        # Запрос подтверждения только при первом запуске скрипта
+        bot.confirm_start()
+    bot.price_source.start() # Подключаемся к потоку цен
+    user_stream = None
+    if bot.config.order_mode == 'limit':
+        # Исполнения лимитных ордеров отслеживаются через поток пользовательских данных
+        user_stream = UserDataStream(bot.on_order_update, API_KEY, API_SECRET, testnet=True)
+        user_stream.start()
 
     # Бесконечный цикл для перезапуска бота после каждого полного цикла (покупка/продажа)
     while True:
@@ -401,14 +776,20 @@ if __name__ == "__main__":
             time.sleep(5)
         except KeyboardInterrupt:
             # Обработка прерывания Ctrl+C
+            if bot.active_orders:
+                print("\nОтменяем активные лимитные ордера...")
+                bot.cancel_active_orders()
             choice = input("\nВыход. Продать все позиции перед выходом? (yes/no): ").strip().lower()
             if choice == 'yes':
                 bot.sell_all_xrp()
             print("Завершение работы бота.")
             break
-            else:
-                break
         except Exception as e:
             print(f"🚨 Критическая ошибка в основном цикле: {e}")
             print("Перезапуск бота после критической ошибки через 10 секунд...")
             time.sleep(10)
+
+    bot.price_source.stop()
+    if user_stream is not None:
+        user_stream.stop()
+    journal.close()
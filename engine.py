@@ -0,0 +1,172 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from binance import AsyncClient, BinanceSocketManager
+
+import bot
+from bot import TradingBot, StrategyConfig, extract_symbol_info
+from price_feed import QueuePriceSource, parse_stream_price
+from symbol_cache import symbol_cache
+from journal import StateJournal
+
+# Параметры движка
+CYCLE_RESTART_DELAY = 5  # Пауза в секундах между циклами одного экземпляра (как в bot.py)
+ERROR_RESTART_DELAY = 10  # Пауза после критической ошибки в экземпляре
+RECONNECT_DELAY = 5  # Пауза перед переподключением к потоку цен
+TICK_QUEUE_SIZE = 1000  # Максимум необработанных тиков на экземпляр (старые тики отбрасываются)
+
+
+class BotEngine:
+    """
+    Запускает несколько экземпляров TradingBot в одном процессе на asyncio.
+    Все экземпляры используют один клиент Binance (общий пул соединений), один запрос
+    exchangeInfo (через кэш на диске) и один комбинированный websocket-поток цен, который раздаётся экземплярам.
+    Ордера выполняются в пуле потоков, поэтому экземпляры не блокируют друг друга.
+    """
+
+    def __init__(self, configs, client=None, stream=bot.PRICE_STREAM, max_workers=None):
+        self.configs = list(configs)
+        self.client = client if client is not None else bot.client
+        self.stream = stream
+        self.max_workers = max_workers or max(4, len(self.configs))
+        self.executor = None
+        self.instances = []  # Пары (TradingBot, asyncio.Queue)
+        self.subscribers = {}  # symbol -> список очередей экземпляров, торгующих этой парой
+
+    def _share_connection_pool(self):
+        """Расширяет пул HTTP-соединений общего клиента под количество одновременных запросов."""
+        session = getattr(self.client, 'session', None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount('https://', adapter)
+
+    def create_instances(self):
+        """Создает экземпляры ботов; информация о всех парах загружается одним запросом."""
+        self._share_connection_pool()
+        exchange_info = symbol_cache.get_many(self.client, sorted({config.symbol for config in self.configs}))
+        seen = {}
+        for config in self.configs:
+            symbol_info = extract_symbol_info(exchange_info, config.symbol)
+            if symbol_info is None:
+                print(f"❌ Торговая пара {config.symbol} не найдена на бирже. Экземпляр пропущен.")
+                continue
+            # У каждого экземпляра свой журнал; второй и следующие экземпляры пары получают номер
+            seen[config.symbol] = seen.get(config.symbol, 0) + 1
+            name = config.symbol if seen[config.symbol] == 1 else f"{config.symbol}-{seen[config.symbol]}"
+            # Цены экземпляр получает из общего потока; QueuePriceSource нужен для совместимости с run()
+            instance = TradingBot(config, price_source=QueuePriceSource(), client=self.client,
+                                  symbol_info=symbol_info, journal=StateJournal(name))
+            if instance.restore_from_journal():
+                instance.reconcile()
+            queue = asyncio.Queue(maxsize=TICK_QUEUE_SIZE)
+            self.instances.append((instance, queue))
+            self.subscribers.setdefault(config.symbol, []).append(queue)
+
+        required = sum(instance.required_balance for instance, _ in self.instances)
+        print(f"📊 Запущено экземпляров: {len(self.instances)}. Требуемый баланс для всех шагов: {required} USDT")
+
+    def dispatch(self, symbol, price):
+        """Раздает тик всем экземплярам, торгующим данной парой."""
+        for queue in self.subscribers.get(symbol, ()):
+            if queue.full():
+                queue.get_nowait() # Отбрасываем самый старый тик
+            queue.put_nowait(price)
+
+    async def _market_data(self):
+        """Читает один комбинированный websocket-поток для всех пар и раздает цены экземплярам."""
+        streams = [f"{symbol.lower()}@{self.stream}" for symbol in self.subscribers]
+        while True:
+            async_client = None
+            try:
+                async_client = await AsyncClient.create(bot.API_KEY, bot.API_SECRET, testnet=True)
+                manager = BinanceSocketManager(async_client)
+                async with manager.multiplex_socket(streams) as socket:
+                    while True:
+                        msg = await socket.recv()
+                        data = msg.get('data', msg)
+                        price = parse_stream_price(data)
+                        if price is not None and 's' in data:
+                            self.dispatch(data['s'], price)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка потока цен: {e}. Переподключение через {RECONNECT_DELAY} сек.")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                if async_client is not None:
+                    await async_client.close_connection()
+
+    async def _user_data(self):
+        """Читает поток пользовательских данных и передает события ордеров экземплярам в режиме 'limit'."""
+        loop = asyncio.get_running_loop()
+        limit_instances = [instance for instance, _ in self.instances if instance.config.order_mode == 'limit']
+        while True:
+            async_client = None
+            try:
+                async_client = await AsyncClient.create(bot.API_KEY, bot.API_SECRET, testnet=True)
+                manager = BinanceSocketManager(async_client)
+                async with manager.user_socket() as socket:
+                    while True:
+                        event = await socket.recv()
+                        if event.get('e') != 'executionReport':
+                            continue
+                        for instance in limit_instances:
+                            if instance.config.symbol == event['s']:
+                                await loop.run_in_executor(self.executor, instance.on_order_update, event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ошибка потока пользовательских данных: {e}. Переподключение через {RECONNECT_DELAY} сек.")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                if async_client is not None:
+                    await async_client.close_connection()
+
+    async def _run_instance(self, instance, queue):
+        """Обрабатывает тики одного экземпляра; торговые решения выполняются в пуле потоков."""
+        loop = asyncio.get_running_loop()
+        while True:
+            price = await queue.get()
+            try:
+                cycle_done = await loop.run_in_executor(self.executor, instance.process_tick, price)
+            except Exception as e:
+                print(f"🚨 Критическая ошибка в экземпляре {instance.config.symbol}: {e}")
+                await asyncio.sleep(ERROR_RESTART_DELAY)
+                continue
+
+            if cycle_done:
+                print(f"\n🔄 {instance.config.symbol}: цикл завершен. Перезапуск через {CYCLE_RESTART_DELAY} секунд...")
+                await asyncio.sleep(CYCLE_RESTART_DELAY)
+                # Тики, накопившиеся за паузу, устарели - новый цикл начинаем с самой свежей цены
+                while queue.qsize() > 1:
+                    queue.get_nowait()
+
+    async def run(self):
+        """Запускает все экземпляры и общий поток цен."""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.create_instances)
+            if not self.instances:
+                print("❌ Нет ни одного экземпляра для запуска.")
+                return
+            tasks = [asyncio.create_task(self._run_instance(instance, queue))
+                     for instance, queue in self.instances]
+            tasks.append(asyncio.create_task(self._market_data()))
+            if any(instance.config.order_mode == 'limit' for instance, _ in self.instances):
+                tasks.append(asyncio.create_task(self._user_data()))
+            await asyncio.gather(*tasks)
+        finally:
+            self.executor.shutdown(wait=False)
+            for instance, _ in self.instances:
+                instance.journal.close()
+
+
+if __name__ == "__main__":
+    # Список стратегий: у каждого экземпляра своя пара и свои параметры
+    configs = [
+        StrategyConfig(),
+    ]
+    try:
+        asyncio.run(BotEngine(configs).run())
+    except KeyboardInterrupt:
+        print("Завершение работы движка.")
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+
+# Параметры журнала состояния
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state')
+JOURNAL_FSYNC_INTERVAL = 0.2  # Записи сбрасываются на диск (fsync) пачками не реже этого интервала в секундах
+JOURNAL_SNAPSHOT_EVERY = 1000  # После стольких записей журнал сжимается в снимок состояния
+
+
+class StateJournal:
+    """
+    Журнал состояния бота: добавляемые в конец записи JSON Lines об исполнениях ордеров и переходах состояния.
+    Записи сбрасываются на диск пачками; журнал периодически сжимается в снимок последнего состояния.
+    При запуске состояние восстанавливается по снимку и записям журнала после него.
+    """
+
+    def __init__(self, name, directory=JOURNAL_DIR, fsync_interval=JOURNAL_FSYNC_INTERVAL,
+                 snapshot_every=JOURNAL_SNAPSHOT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.journal_path = os.path.join(directory, f"{name}.journal")
+        self.snapshot_path = os.path.join(directory, f"{name}.snapshot.json")
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.seq = 0  # Номер последней записи
+        self.records_since_snapshot = 0
+        self._lock = threading.Lock()
+        self._dirty = False  # Есть записи, еще не сброшенные на диск
+        self._last_sync = time.monotonic()
+        self._file = None
+        self._closed = False
+        self._flusher = None
+
+    def load(self):
+        """Восстанавливает последнее сохраненное состояние: снимок + записи журнала после него. None, если данных нет."""
+        state = None
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            state = snapshot['state']
+            snapshot_seq = snapshot['seq']
+        self.seq = snapshot_seq
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break # Недописанная последняя строка после сбоя
+                    if record['seq'] <= snapshot_seq:
+                        continue # Запись уже учтена в снимке
+                    self.seq = record['seq']
+                    self.records_since_snapshot += 1
+                    if record['type'] == 'state':
+                        state = record['state']
+        return state
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.journal_path, 'a')
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """Фоновый сброс на диск: записи, сделанные между fsync, попадают на диск не позже fsync_interval."""
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._dirty and self._file is not None:
+                    self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def append(self, record_type, **data):
+        """Добавляет запись в журнал."""
+        with self._lock:
+            self._open()
+            self.seq += 1
+            record = {'seq': self.seq, 'time': time.time(), 'type': record_type, **data}
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush() # Запись попадает в кэш ОС сразу и переживает падение процесса
+            self._dirty = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            self.records_since_snapshot += 1
+
+    def record_fill(self, **fill):
+        """Записывает исполнение ордера."""
+        self.append('fill', **fill)
+
+    def record_state(self, state, event):
+        """Записывает новое состояние бота; при необходимости сжимает журнал в снимок."""
+        self.append('state', event=event, state=state)
+        if self.records_since_snapshot >= self.snapshot_every:
+            self.snapshot(state)
+
+    def snapshot(self, state):
+        """Сохраняет снимок состояния и начинает журнал заново."""
+        with self._lock:
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'seq': self.seq, 'time': time.time(), 'state': state}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # Если сбой случится до очистки журнала, записи с seq <= снимка будут пропущены при загрузке
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.journal_path, 'w')
+            self._sync()
+            self.records_since_snapshot = 0
+
+    def close(self):
+        """Сбрасывает записи на диск и закрывает журнал."""
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from bot import StrategyConfig
+from backtest import Backtester, load_prices, make_symbol_info, PRICE_DECIMALS
+
+# Пространство поиска: для каждого параметра - список проверяемых значений
+SEARCH_SPACE = {
+    'decline_percent': ['0.2', '0.5', '1', '1.5', '2', '3'],
+    'multiplier': ['1.1', '1.2', '1.3', '1.4', '1.5', '2'],
+    'max_steps': [5, 8, 10, 12, 15],
+    'profit_percent': ['0.3', '0.5', '1', '1.5', '2'],
+    'initial_amount': ['10', '20', '50'],
+}
+TOP_RESULTS = 20  # Сколько лучших наборов параметров выводить
+
+# Данные рабочего процесса: загружаются один раз при старте процесса (см. _init_worker)
+_worker = {}
+
+
+def iter_grid(space):
+    """Перебирает все сочетания параметров из пространства поиска."""
+    names = list(space)
+    for values in itertools.product(*(space[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def sample_random(space, count, seed=None):
+    """Выбирает count случайных сочетаний параметров без повторений."""
+    names = list(space)
+    sizes = [len(space[name]) for name in names]
+    total = 1
+    for size in sizes:
+        total *= size
+    rng = random.Random(seed)
+    combos = []
+    # Номер сочетания раскладывается по основаниям sizes, поэтому весь перебор не материализуется
+    for index in rng.sample(range(total), min(count, total)):
+        combo = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, k = divmod(index, size)
+            combo[name] = space[name][k]
+        combos.append({name: combo[name] for name in names})
+    return combos
+
+
+def params_key(params):
+    """Строковый ключ набора параметров (для контрольной точки)."""
+    return json.dumps({name: str(value) for name, value in params.items()}, sort_keys=True)
+
+
+def prepare_data(path, kind, cache_prefix):
+    """
+    Сохраняет цены (целые, в масштабе PRICE_DECIMALS) и время в .npy файлы для отображения в память.
+    Рабочие процессы читают общий файл через mmap вместо копирования массива в каждый процесс.
+    """
+    prices_path = cache_prefix + '.prices.npy'
+    times_path = cache_prefix + '.times.npy'
+    if not (os.path.exists(prices_path) and os.path.exists(times_path)):
+        prices, times = load_prices(path, kind=kind)
+        np.save(prices_path, np.rint(prices * 10 ** PRICE_DECIMALS).astype(np.int64))
+        np.save(times_path, times.astype(np.float64))
+    return prices_path, times_path
+
+
+def load_checkpoint(checkpoint_path):
+    """Читает уже посчитанные результаты из файла контрольной точки (JSON Lines)."""
+    results = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # Последняя строка могла быть записана не полностью при прерывании
+                results[params_key(record['params'])] = record
+    return results
+
+
+def _init_worker(prices_path, times_path, symbol_info, base_params):
+    """Инициализация рабочего процесса: отображает общие данные в память."""
+    _worker['prices'] = np.load(prices_path, mmap_mode='r')
+    _worker['times'] = np.load(times_path, mmap_mode='r')
+    _worker['symbol_info'] = symbol_info
+    _worker['base_params'] = base_params
+
+
+def _evaluate(params):
+    """Прогоняет бэктест для одного набора параметров."""
+    record = {'params': {name: str(value) for name, value in params.items()}}
+    config = StrategyConfig(**{**_worker['base_params'], **params})
+    if config.initial_amount < _worker['symbol_info']['minNotional']:
+        record['error'] = 'initial_amount ниже minNotional'
+        return record
+
+    result = Backtester(config, _worker['symbol_info']).run(_worker['prices'], _worker['times'])
+    s = result.summary
+    total_pnl = s['realized_pnl'] + s['unrealized_pnl']
+    # Доходность относительно капитала, необходимого для всех шагов (_calculate_required_balance)
+    record.update({
+        'required_balance': str(s['capital']),
+        'realized_pnl': str(s['realized_pnl']),
+        'unrealized_pnl': str(s['unrealized_pnl']),
+        'score': float(total_pnl / s['capital'] * 100) if s['capital'] else 0.0,
+        'closed_cycles': s['closed_cycles'],
+        'max_steps_cycles': s['max_steps_cycles'],
+        'max_drawdown': s['max_drawdown'],
+    })
+    return record
+
+
+def run_sweep(combos, prices_path, times_path, symbol_info, checkpoint_path, base_params=None, workers=None):
+    """
+    Считает бэктест для всех наборов параметров в пуле процессов.
+    Каждый результат сразу дописывается в контрольную точку; при повторном запуске посчитанные наборы пропускаются.
+    """
+    base_params = base_params or {}
+    done = load_checkpoint(checkpoint_path)
+    pending = [params for params in combos if params_key(params) not in done]
+    print(f"📊 Наборов параметров: {len(done) + len(pending)}, уже посчитано: {len(done)}, осталось: {len(pending)}")
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(pending) // (workers * 16))
+    with open(checkpoint_path, 'a') as checkpoint, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(prices_path, times_path, symbol_info, base_params)) as executor:
+        for k, record in enumerate(executor.map(_evaluate, pending, chunksize=chunksize), 1):
+            checkpoint.write(json.dumps(record) + '\n')
+            checkpoint.flush()
+            done[params_key(record['params'])] = record
+            if k % 100 == 0:
+                print(f"⏳ Посчитано {k}/{len(pending)}")
+    return rank_results(done.values())
+
+
+def rank_results(records):
+    """Сортирует результаты по доходности на требуемый капитал."""
+    valid = [r for r in records if 'error' not in r]
+    return sorted(valid, key=lambda r: r['score'], reverse=True)
+
+
+def print_ranking(ranked, top=TOP_RESULTS):
+    """Выводит лучшие наборы параметров."""
+    print("\n" + "="*50)
+    print(f"🏆 Лучшие наборы параметров (доходность на требуемый капитал):")
+    for place, r in enumerate(ranked[:top], 1):
+        params = ', '.join(f"{name}={value}" for name, value in r['params'].items())
+        print(f"{place:>3}. {r['score']:.2f}% | капитал {r['required_balance']} USDT | "
+              f"циклов {r['closed_cycles']}, до MAX_STEPS {r['max_steps_cycles']} | {params}")
+    print("="*50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подбор параметров DCA-стратегии на исторических данных")
+    parser.add_argument('path', help="CSV или Parquet файл со свечами или сделками Binance")
+    parser.add_argument('--kind', choices=('klines', 'trades'), default='klines')
+    parser.add_argument('--mode', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--samples', type=int, default=500, help="Количество наборов для случайного поиска")
+    parser.add_argument('--seed', type=int, default=0, help="Зерно случайного поиска (одинаковое при продолжении)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', default='sweep.jsonl', help="Файл контрольной точки для продолжения поиска")
+    parser.add_argument('--step-size', default='0.1')
+    parser.add_argument('--min-qty', default='0.1')
+    parser.add_argument('--min-notional', default='5')
+    args = parser.parse_args()
+
+    config = StrategyConfig()
+    symbol_info = make_symbol_info(config.symbol, args.step_size, args.min_qty, args.min_notional)
+    prices_path, times_path = prepare_data(args.path, args.kind, os.path.splitext(args.checkpoint)[0])
+    if args.mode == 'grid':
+        combos = list(iter_grid(SEARCH_SPACE))
+    else:
+        combos = sample_random(SEARCH_SPACE, args.samples, seed=args.seed)
+    ranked = run_sweep(combos, prices_path, times_path, symbol_info, args.checkpoint, workers=args.workers)
+    print_ranking(ranked)
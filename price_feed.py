@@ -0,0 +1,137 @@
+import queue
+import time
+import decimal
+
+
+class PriceSource:
+    """Базовый интерфейс источника цен: бот получает цены по мере их поступления."""
+
+    def __init__(self, fallback=None, stale_after=10):
+        self.fallback = fallback  # Функция запасного получения цены (например, REST-запрос)
+        self.stale_after = stale_after  # Через сколько секунд без тиков обращаться к fallback
+        self.closed = False
+
+    def start(self):
+        """Запускает источник (подключение к потоку и т.п.)."""
+        self.closed = False
+
+    def stop(self):
+        """Останавливает источник; генератор ticks() после этого завершится."""
+        self.closed = True
+
+    def next_price(self, timeout=None):
+        """Возвращает следующую цену или None, если за timeout секунд тиков не было."""
+        raise NotImplementedError
+
+    def ticks(self):
+        """Генератор цен: отдаёт каждый тик сразу после его поступления."""
+        while not self.closed:
+            price = self.next_price(timeout=self.stale_after)
+            if price is None:
+                # Поток молчит слишком долго - пробуем получить цену запасным способом
+                if self.fallback is not None and not self.closed:
+                    price = self.fallback()
+                if price is None:
+                    continue
+            yield price
+
+
+class QueuePriceSource(PriceSource):
+    """Источник цен на основе потокобезопасной очереди. Цены можно добавлять из любого потока через push()."""
+
+    def __init__(self, fallback=None, stale_after=10, maxsize=10000):
+        super().__init__(fallback=fallback, stale_after=stale_after)
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def push(self, price):
+        """Добавляет цену в очередь. При переполнении отбрасывается самый старый тик."""
+        price = decimal.Decimal(price)
+        while True:
+            try:
+                self._queue.put_nowait(price)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next_price(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ReplayPriceSource(PriceSource):
+    """Воспроизводит заранее заданную последовательность цен (для тестов и отладки)."""
+
+    def __init__(self, prices, delay=0):
+        super().__init__()
+        self._prices = iter(prices)
+        self.delay = delay  # Пауза между тиками в секундах (0 - максимально быстро)
+
+    def next_price(self, timeout=None):
+        if self.closed:
+            return None
+        try:
+            price = next(self._prices)
+        except StopIteration:
+            self.closed = True  # Данные закончились
+            return None
+        if self.delay:
+            time.sleep(self.delay)
+        return decimal.Decimal(price)
+
+
+class BinanceStreamSource(QueuePriceSource):
+    """Потоковые цены Binance через websocket (поток trade или bookTicker)."""
+
+    def __init__(self, symbol, api_key=None, api_secret=None, testnet=True,
+                 stream='trade', fallback=None, stale_after=10):
+        super().__init__(fallback=fallback, stale_after=stale_after)
+        if stream not in ('trade', 'bookTicker'):
+            raise ValueError(f"Неизвестный тип потока: {stream}")
+        self.symbol = symbol
+        self.stream = stream
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.testnet = testnet
+        self._twm = None
+
+    def start(self):
+        from binance import ThreadedWebsocketManager
+
+        super().start()
+        self._twm = ThreadedWebsocketManager(self.api_key, self.api_secret, testnet=self.testnet)
+        self._twm.start()
+        if self.stream == 'trade':
+            self._twm.start_trade_socket(callback=self._handle_message, symbol=self.symbol)
+        else:
+            self._twm.start_symbol_book_ticker_socket(callback=self._handle_message, symbol=self.symbol)
+
+    def stop(self):
+        super().stop()
+        if self._twm is not None:
+            self._twm.stop()
+            self._twm = None
+
+    def _handle_message(self, msg):
+        """Обрабатывает сообщение websocket и кладёт цену в очередь."""
+        price = parse_stream_price(msg)
+        if price is not None:
+            self.push(price)
+
+
+def parse_stream_price(msg):
+    """Извлекает цену из сообщения потока trade или bookTicker. Для bookTicker берётся середина спреда."""
+    if msg.get('e') == 'error':
+        print(f"❌ Ошибка потока цен: {msg.get('m')}")
+        return None
+    if 'data' in msg:  # Сообщение из комбинированного (multiplex) потока
+        msg = msg['data']
+    if 'p' in msg:
+        return decimal.Decimal(msg['p'])
+    if 'b' in msg and 'a' in msg:
+        return (decimal.Decimal(msg['b']) + decimal.Decimal(msg['a'])) / 2
+    return None
@@ -0,0 +1,421 @@
+import argparse
+import contextlib
+import decimal
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from binance.exceptions import BinanceAPIException
+
+from bot import TradingBot, StrategyConfig, extract_symbol_info
+from price_feed import ReplayPriceSource
+
+# Параметры симулятора
+SIM_COMMISSION = decimal.Decimal('0.001')  # Комиссия симулируемой биржи (0.1%, как у Binance)
+SIM_BNB_DISCOUNT = decimal.Decimal('0.75')  # Множитель комиссии при оплате в BNB
+SIM_START_TIME = 1700000000.0  # Начальное время виртуальных часов (секунды с эпохи)
+COMMISSION_PRECISION = decimal.Decimal('0.00000001')  # Binance округляет комиссию до 8 знаков
+
+# Торговые пары по умолчанию (фильтры как у XRPUSDT на Binance)
+DEFAULT_SYMBOLS = {
+    'XRPUSDT': {
+        'baseAsset': 'XRP', 'quoteAsset': 'USDT',
+        'minQty': '0.1', 'maxQty': '9222449', 'stepSize': '0.1',
+        'tickSize': '0.0001', 'minNotional': '5',
+    },
+}
+
+
+class VirtualClock:
+    """Виртуальные часы: время идет только при вызове advance()/sleep(), без реального ожидания."""
+
+    def __init__(self, start=SIM_START_TIME):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def api_error(code, message, status_code=400):
+    """Создает BinanceAPIException так же, как его создает python-binance по ответу биржи."""
+    return BinanceAPIException(None, status_code, json.dumps({'code': code, 'msg': message}))
+
+
+def fmt(value):
+    """Число в строку в формате ответов Binance (без экспоненты)."""
+    return format(value, 'f')
+
+
+class SimulatedExchange:
+    """
+    Биржа в памяти процесса с тем же интерфейсом, что и методы binance.Client, используемые ботом:
+    get_exchange_info, get_symbol_ticker, get_asset_balance, create_order, cancel_order, get_order, get_open_orders.
+    Проверяет фильтры LOT_SIZE, PRICE_FILTER и NOTIONAL, удерживает комиссию, частично исполняет лимитные ордера
+    и может возвращать ошибки API (например, -2010). Время идет по виртуальным часам.
+    """
+
+    def __init__(self, symbols=None, balances=None, commission=SIM_COMMISSION, clock=None,
+                 market_levels=1, limit_fill_ratio=1, bnb_fee=False, bnb_price='600'):
+        self.clock = clock if clock is not None else VirtualClock()
+        self.symbols = {}
+        for symbol, info in (symbols or DEFAULT_SYMBOLS).items():
+            self.symbols[symbol] = {k: (v if k.endswith('Asset') else decimal.Decimal(v)) for k, v in info.items()}
+        self.balances = {}
+        for asset, amount in (balances or {'USDT': '10000'}).items():
+            self.balances[asset] = {'free': decimal.Decimal(amount), 'locked': decimal.Decimal('0')}
+        self.commission = decimal.Decimal(commission)
+        self.market_levels = market_levels  # На сколько ценовых уровней (тиков) дробится рыночный ордер
+        self.limit_fill_ratio = decimal.Decimal(limit_fill_ratio)  # Доля лимитного ордера, исполняемая за один тик
+        self.bnb_fee = bnb_fee  # Оплачивать комиссию в BNB со скидкой, если хватает BNB
+        self.bnb_price = decimal.Decimal(bnb_price)  # Цена BNB в активе котировки для расчета комиссии
+        self.prices = {}
+        self.orders = {}  # orderId -> ордер
+        self.trades = []  # Все сделки симуляции
+        self.request_count = {}  # Количество вызовов по методам API
+        self.listeners = []  # Обработчики событий executionReport
+        self._pending_events = []
+        self._injected_errors = []  # [метод, код, сообщение, сколько раз]
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+
+    # --- Управление симуляцией ---
+
+    def subscribe(self, callback):
+        """Подписывает обработчик на события исполнения ордеров (как поток пользовательских данных)."""
+        self.listeners.append(callback)
+
+    def inject_error(self, method, code, message, count=1):
+        """Следующие count вызовов метода завершатся ошибкой API с заданным кодом."""
+        self._injected_errors.append([method, code, message, count])
+
+    def tick(self, symbol, price, seconds=1):
+        """Продвигает время, устанавливает новую цену и исполняет лимитные ордера, которых она достигла."""
+        self.clock.advance(seconds)
+        self.flush_events()
+        price = decimal.Decimal(price)
+        self.prices[symbol] = price
+        for order in list(self.orders.values()):
+            if order['symbol'] != symbol or order['status'] not in ('NEW', 'PARTIALLY_FILLED'):
+                continue
+            if (order['side'] == 'BUY' and price <= order['price']) or (order['side'] == 'SELL' and price >= order['price']):
+                remaining = order['origQty'] - order['executedQty']
+                step = self.symbols[symbol]['stepSize']
+                portion = (order['origQty'] * self.limit_fill_ratio / step).to_integral_value(rounding=decimal.ROUND_CEILING) * step
+                self._execute(order, min(remaining, max(portion, step)), order['price'])
+
+    def flush_events(self):
+        """
+        Доставляет накопленные события подписчикам. События доставляются после возврата из вызова API,
+        как у настоящего websocket-потока, который работает независимо от REST-запросов.
+        """
+        while self._pending_events:
+            event = self._pending_events.pop(0)
+            for callback in self.listeners:
+                callback(event)
+
+    def _request(self, method):
+        self.request_count[method] = self.request_count.get(method, 0) + 1
+        for injected in self._injected_errors:
+            if injected[0] == method and injected[3] > 0:
+                injected[3] -= 1
+                raise api_error(injected[1], injected[2])
+
+    def _balance(self, asset):
+        return self.balances.setdefault(asset, {'free': decimal.Decimal('0'), 'locked': decimal.Decimal('0')})
+
+    # --- Методы binance.Client ---
+
+    def get_exchange_info(self):
+        self._request('get_exchange_info')
+        symbols = []
+        for symbol, info in self.symbols.items():
+            symbols.append({
+                'symbol': symbol, 'status': 'TRADING',
+                'baseAsset': info['baseAsset'], 'quoteAsset': info['quoteAsset'],
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': fmt(info['tickSize']), 'maxPrice': '1000000',
+                     'tickSize': fmt(info['tickSize'])},
+                    {'filterType': 'LOT_SIZE', 'minQty': fmt(info['minQty']), 'maxQty': fmt(info['maxQty']),
+                     'stepSize': fmt(info['stepSize'])},
+                    {'filterType': 'NOTIONAL', 'minNotional': fmt(info['minNotional'])},
+                ],
+            })
+        return {'timezone': 'UTC', 'serverTime': int(self.clock.time() * 1000), 'symbols': symbols}
+
+    def get_symbol_ticker(self, symbol):
+        self._request('get_symbol_ticker')
+        if symbol not in self.prices:
+            raise api_error(-1121, 'Invalid symbol.')
+        return {'symbol': symbol, 'price': fmt(self.prices[symbol])}
+
+    def get_asset_balance(self, asset):
+        self._request('get_asset_balance')
+        balance = self._balance(asset)
+        return {'asset': asset, 'free': fmt(balance['free']), 'locked': fmt(balance['locked'])}
+
+    def create_order(self, symbol, side, type, quantity=None, price=None, timeInForce=None, **params):
+        self._request('create_order')
+        if symbol not in self.symbols:
+            raise api_error(-1121, 'Invalid symbol.')
+        info = self.symbols[symbol]
+        quantity = decimal.Decimal(str(quantity))
+        market_price = self.prices[symbol]
+        order_price = decimal.Decimal(str(price)) if price is not None else None
+        self._validate(info, quantity, order_price if type == 'LIMIT' else market_price, type)
+
+        order = {
+            'symbol': symbol, 'orderId': next(self._order_ids), 'clientOrderId': params.get('newClientOrderId', ''),
+            'side': side, 'type': type, 'timeInForce': timeInForce or '', 'price': order_price or decimal.Decimal('0'),
+            'origQty': quantity, 'executedQty': decimal.Decimal('0'), 'cummulativeQuoteQty': decimal.Decimal('0'),
+            'status': 'NEW', 'fills': [], 'transactTime': int(self.clock.time() * 1000),
+        }
+        base, quote = self._balance(info['baseAsset']), self._balance(info['quoteAsset'])
+
+        if type == 'MARKET':
+            levels = self._market_levels(info, side, quantity, market_price)
+            if side == 'BUY':
+                cost = sum(q * p for q, p in levels)
+                if quote['free'] < cost:
+                    raise api_error(-2010, 'Account has insufficient balance for requested action.')
+            elif base['free'] < quantity:
+                raise api_error(-2010, 'Account has insufficient balance for requested action.')
+            self.orders[order['orderId']] = order
+            self._event(order, 'NEW')
+            for level_qty, level_price in levels:
+                self._execute(order, level_qty, level_price)
+        elif type == 'LIMIT':
+            if side == 'BUY':
+                if quote['free'] < quantity * order_price:
+                    raise api_error(-2010, 'Account has insufficient balance for requested action.')
+                quote['free'] -= quantity * order_price
+                quote['locked'] += quantity * order_price
+            else:
+                if base['free'] < quantity:
+                    raise api_error(-2010, 'Account has insufficient balance for requested action.')
+                base['free'] -= quantity
+                base['locked'] += quantity
+            self.orders[order['orderId']] = order
+            self._event(order, 'NEW')
+            # Ордер, пересекающий текущую цену, исполняется сразу по лучшей цене
+            if (side == 'BUY' and market_price <= order_price) or (side == 'SELL' and market_price >= order_price):
+                self._execute(order, quantity, market_price)
+        else:
+            raise api_error(-1116, 'Invalid orderType.')
+        return self._order_response(order, with_fills=True)
+
+    def cancel_order(self, symbol, orderId, **params):
+        self._request('cancel_order')
+        order = self.orders.get(orderId)
+        if order is None or order['symbol'] != symbol or order['status'] not in ('NEW', 'PARTIALLY_FILLED'):
+            raise api_error(-2011, 'Unknown order sent.')
+        info = self.symbols[symbol]
+        remaining = order['origQty'] - order['executedQty']
+        if order['side'] == 'BUY':
+            quote = self._balance(info['quoteAsset'])
+            quote['locked'] -= remaining * order['price']
+            quote['free'] += remaining * order['price']
+        else:
+            base = self._balance(info['baseAsset'])
+            base['locked'] -= remaining
+            base['free'] += remaining
+        order['status'] = 'CANCELED'
+        self._event(order, 'CANCELED')
+        return self._order_response(order)
+
+    def get_order(self, symbol, orderId, **params):
+        self._request('get_order')
+        order = self.orders.get(orderId)
+        if order is None or order['symbol'] != symbol:
+            raise api_error(-2013, 'Order does not exist.')
+        return self._order_response(order)
+
+    def get_open_orders(self, symbol=None, **params):
+        self._request('get_open_orders')
+        return [self._order_response(o) for o in self.orders.values()
+                if o['status'] in ('NEW', 'PARTIALLY_FILLED') and (symbol is None or o['symbol'] == symbol)]
+
+    # --- Внутренняя логика ---
+
+    def _validate(self, info, quantity, price, type):
+        """Проверяет фильтры пары так же, как Binance (ошибка -1013)."""
+        if quantity < info['minQty'] or quantity > info['maxQty'] or quantity % info['stepSize'] != 0:
+            raise api_error(-1013, 'Filter failure: LOT_SIZE')
+        if type == 'LIMIT' and (price is None or price <= 0 or price % info['tickSize'] != 0):
+            raise api_error(-1013, 'Filter failure: PRICE_FILTER')
+        if quantity * price < info['minNotional']:
+            raise api_error(-1013, 'Filter failure: NOTIONAL')
+
+    def _market_levels(self, info, side, quantity, price):
+        """Разбивает рыночный ордер на несколько уровней стакана (каждый следующий на тик хуже)."""
+        step = info['stepSize']
+        levels = []
+        remaining = quantity
+        per_level = (quantity / self.market_levels / step).to_integral_value(rounding=decimal.ROUND_DOWN) * step
+        for level in range(self.market_levels):
+            level_qty = remaining if level == self.market_levels - 1 else min(per_level, remaining)
+            if level_qty <= 0:
+                continue
+            shift = info['tickSize'] * level
+            levels.append((level_qty, price + shift if side == 'BUY' else price - shift))
+            remaining -= level_qty
+        return levels
+
+    def _execute(self, order, quantity, price):
+        """Исполняет часть ордера: переводит активы, удерживает комиссию, записывает сделку и событие."""
+        info = self.symbols[order['symbol']]
+        base, quote = self._balance(info['baseAsset']), self._balance(info['quoteAsset'])
+        quote_qty = quantity * price
+        limit = order['type'] == 'LIMIT'
+
+        # Комиссия: в BNB со скидкой, если включено и хватает BNB, иначе в получаемом активе
+        commission_asset = info['baseAsset'] if order['side'] == 'BUY' else info['quoteAsset']
+        commission = (quantity if order['side'] == 'BUY' else quote_qty) * self.commission
+        if self.bnb_fee:
+            bnb_commission = (quote_qty * self.commission * SIM_BNB_DISCOUNT / self.bnb_price).quantize(COMMISSION_PRECISION)
+            if self._balance('BNB')['free'] >= bnb_commission:
+                commission_asset, commission = 'BNB', bnb_commission
+        commission = commission.quantize(COMMISSION_PRECISION)
+
+        if order['side'] == 'BUY':
+            if limit:
+                quote['locked'] -= quantity * order['price']
+                quote['free'] += quantity * order['price'] - quote_qty # Возврат разницы при исполнении лучше лимита
+            else:
+                quote['free'] -= quote_qty
+            base['free'] += quantity
+        else:
+            if limit:
+                base['locked'] -= quantity
+            else:
+                base['free'] -= quantity
+            quote['free'] += quote_qty
+        self._balance(commission_asset)['free'] -= commission
+
+        order['executedQty'] += quantity
+        order['cummulativeQuoteQty'] += quote_qty
+        order['status'] = 'FILLED' if order['executedQty'] == order['origQty'] else 'PARTIALLY_FILLED'
+        fill = {'price': fmt(price), 'qty': fmt(quantity), 'commission': fmt(commission),
+                'commissionAsset': commission_asset, 'tradeId': next(self._trade_ids)}
+        order['fills'].append(fill)
+        self.trades.append({'symbol': order['symbol'], 'orderId': order['orderId'], 'side': order['side'],
+                            'time': self.clock.time(), **fill})
+        self._event(order, 'TRADE', quantity, price, commission, commission_asset)
+
+    def _event(self, order, execution_type, last_qty=0, last_price=0, commission=0, commission_asset=None):
+        """Ставит в очередь событие executionReport в формате потока пользовательских данных Binance."""
+        self._pending_events.append({
+            'e': 'executionReport', 'E': int(self.clock.time() * 1000), 's': order['symbol'],
+            'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'], 'f': order['timeInForce'],
+            'q': fmt(order['origQty']), 'p': fmt(order['price']), 'x': execution_type, 'X': order['status'],
+            'i': order['orderId'], 'l': fmt(decimal.Decimal(last_qty)), 'z': fmt(order['executedQty']),
+            'L': fmt(decimal.Decimal(last_price)), 'n': fmt(decimal.Decimal(commission)), 'N': commission_asset,
+            'T': int(self.clock.time() * 1000), 'Z': fmt(order['cummulativeQuoteQty']),
+        })
+
+    def _order_response(self, order, with_fills=False):
+        response = {
+            'symbol': order['symbol'], 'orderId': order['orderId'], 'clientOrderId': order['clientOrderId'],
+            'transactTime': order['transactTime'], 'price': fmt(order['price']), 'origQty': fmt(order['origQty']),
+            'executedQty': fmt(order['executedQty']), 'cummulativeQuoteQty': fmt(order['cummulativeQuoteQty']),
+            'status': order['status'], 'timeInForce': order['timeInForce'], 'type': order['type'], 'side': order['side'],
+        }
+        if with_fills:
+            response['fills'] = list(order['fills'])
+        return response
+
+
+def make_bot(exchange, config=None):
+    """Создает TradingBot, работающий с симулятором и его виртуальными часами."""
+    config = config if config is not None else StrategyConfig()
+    symbol_info = extract_symbol_info(exchange.get_exchange_info(), config.symbol)
+    bot = TradingBot(config, price_source=ReplayPriceSource(()), client=exchange,
+                     symbol_info=symbol_info, clock=exchange.clock)
+    exchange.subscribe(bot.on_order_update)
+    return bot
+
+
+def mean_reverting_prices(start, volatility=0.002, reversion=0.01, tick='0.0001', seed=None):
+    """Бесконечный генератор цен, колеблющихся вокруг start (процесс Орнштейна-Уленбека)."""
+    rng = random.Random(seed)
+    tick = decimal.Decimal(tick)
+    mean = float(start)
+    price = mean
+    while True:
+        price += reversion * (mean - price) + volatility * mean * rng.gauss(0, 1)
+        price = max(price, float(tick))
+        yield (decimal.Decimal(price) / tick).to_integral_value() * tick
+
+
+def run_session(bot, exchange, prices, max_cycles=None, seconds_per_tick=1):
+    """Прогоняет бота по ценам на симуляторе. Возвращает (количество завершенных циклов, количество тиков)."""
+    cycles = 0
+    ticks = 0
+    for price in prices:
+        exchange.tick(bot.config.symbol, price, seconds_per_tick)
+        ticks += 1
+        if bot.process_tick(price):
+            cycles += 1
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+        exchange.flush_events()
+    exchange.flush_events()
+    return cycles, ticks
+
+
+def check_invariants(bot, exchange):
+    """Проверяет согласованность состояния бота и симулятора. Возвращает список нарушений."""
+    problems = []
+    for asset, balance in exchange.balances.items():
+        if balance['free'] < 0 or balance['locked'] < 0:
+            problems.append(f"отрицательный баланс {asset}: {balance}")
+    held = exchange.balances[bot.base_asset]['free'] + exchange.balances[bot.base_asset]['locked']
+    if bot.total_quantity > held:
+        problems.append(f"бот учитывает {bot.total_quantity} {bot.base_asset}, а на балансе {held}")
+    if bot.current_step > bot.config.max_steps:
+        problems.append(f"шаг {bot.current_step} больше MAX_STEPS")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогон бота на симуляторе биржи с виртуальным временем")
+    parser.add_argument('--cycles', type=int, default=1000, help="Сколько циклов покупки/продажи выполнить")
+    parser.add_argument('--max-ticks', type=int, default=10_000_000)
+    parser.add_argument('--mode', choices=('market', 'limit'), default='market')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--volatility', type=float, default=0.002)
+    parser.add_argument('--verbose', action='store_true', help="Показывать вывод бота")
+    args = parser.parse_args()
+
+    config = StrategyConfig(order_mode=args.mode)
+    exchange = SimulatedExchange(balances={'USDT': '100000'})
+    exchange.prices[config.symbol] = config.start_price
+    prices = itertools.islice(mean_reverting_prices(config.start_price, volatility=args.volatility, seed=args.seed),
+                              args.max_ticks)
+
+    started = time.perf_counter()
+    output = sys.stdout if args.verbose else open(os.devnull, 'w')
+    with contextlib.redirect_stdout(output):
+        bot = make_bot(exchange, config)
+        cycles, ticks = run_session(bot, exchange, prices, max_cycles=args.cycles)
+    elapsed = time.perf_counter() - started
+
+    problems = check_invariants(bot, exchange)
+    print(f"📊 Циклов: {cycles}, тиков: {ticks}, сделок: {len(exchange.trades)}, "
+          f"виртуальное время: {(exchange.clock.time() - SIM_START_TIME) / 3600:.1f} ч, реальное: {elapsed:.2f} сек")
+    print(f"💰 Баланс USDT: {exchange.balances['USDT']['free'] + exchange.balances['USDT']['locked']:.2f}, "
+          f"{bot.base_asset}: {exchange.balances[bot.base_asset]['free'] + exchange.balances[bot.base_asset]['locked']:.4f}")
+    for problem in problems:
+        print(f"❌ {problem}")
+    sys.exit(1 if problems or cycles < args.cycles else 0)
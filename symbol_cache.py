@@ -0,0 +1,79 @@
+import json
+import os
+import time
+
+# Параметры кэша информации о торговых парах
+EXCHANGE_INFO_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.exchange_info.json')
+EXCHANGE_INFO_TTL = 24 * 60 * 60  # Время жизни записи кэша в секундах (фильтры пар меняются редко)
+
+
+def fetch_exchange_info(client, symbols):
+    """Запрашивает exchangeInfo только для нужных пар, а не для всей биржи."""
+    if hasattr(client, '_get'):
+        symbols_param = json.dumps(sorted(symbols), separators=(',', ':'))
+        return client._get('exchangeInfo', data={'symbols': symbols_param})
+    # Клиент без низкоуровневого доступа (например, тестовый) - берем полный ответ
+    return client.get_exchange_info()
+
+
+class SymbolInfoCache:
+    """
+    Кэш exchangeInfo на диске с временем жизни и поиском по паре.
+    Хранит исходные записи пар из ответа Binance; при недоступности API используются устаревшие записи.
+    """
+
+    def __init__(self, path=EXCHANGE_INFO_CACHE, ttl=EXCHANGE_INFO_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries = None  # symbol -> {'fetched_at': время загрузки, 'info': запись пары}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError):
+                    print("⚠️ Файл кэша информации о парах поврежден и будет перезаписан.")
+        return self._entries
+
+    def _save(self):
+        # Запись через временный файл, чтобы прерванная запись не испортила кэш
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get_many(self, client, symbols):
+        """
+        Возвращает записи пар в формате exchangeInfo ({'symbols': [...]}).
+        Из API загружаются только отсутствующие или устаревшие пары.
+        """
+        entries = self._load()
+        now = time.time()
+        stale = [s for s in symbols if s not in entries or now - entries[s]['fetched_at'] > self.ttl]
+        if stale:
+            try:
+                exchange_info = fetch_exchange_info(client, stale)
+            except Exception as e:
+                if any(s not in entries for s in stale):
+                    raise
+                print(f"⚠️ Не удалось обновить информацию о парах ({e}). Используем кэш.")
+            else:
+                for s in exchange_info['symbols']:
+                    if s['symbol'] in stale:
+                        entries[s['symbol']] = {'fetched_at': now, 'info': s}
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"⚠️ Не удалось сохранить кэш информации о парах: {e}")
+        return {'symbols': [entries[s]['info'] for s in symbols if s in entries]}
+
+    def get(self, client, symbol):
+        """Возвращает запись одной пары в формате exchangeInfo."""
+        return self.get_many(client, [symbol])
+
+
+# Общий кэш процесса
+symbol_cache = SymbolInfoCache()
@@ -0,0 +1,43 @@
+import pytest
+
+from bot import StrategyConfig, TradingBot, extract_symbol_info
+from journal import StateJournal
+from price_feed import ReplayPriceSource
+from simulator import check_invariants, run_session
+from test_simulator import held, make_exchange, prices
+
+
+def make_journaled_bot(exchange, config, directory):
+    symbol_info = extract_symbol_info(exchange.get_exchange_info(), config.symbol)
+    bot = TradingBot(config, price_source=ReplayPriceSource(()), client=exchange, symbol_info=symbol_info,
+                     clock=exchange.clock, journal=StateJournal(config.symbol, str(directory)))
+    exchange.subscribe(bot.on_order_update)
+    return bot
+
+
+@pytest.mark.parametrize('mode', ['market', 'limit'])
+def test_journal_restart_continues_cycle(tmp_path, mode):
+    exchange = make_exchange(limit_fill_ratio='0.3')
+    config = StrategyConfig(order_mode=mode, start_price='2.4')
+    path = prices(20000, seed=5)
+    bot = make_journaled_bot(exchange, config, tmp_path)
+    run_session(bot, exchange, path[:10000])
+    state = bot.export_state()
+    bot.journal.close()
+    exchange.listeners.remove(bot.on_order_update)
+
+    restarted = make_journaled_bot(exchange, config, tmp_path)
+    assert restarted.restore_from_journal()
+    restarted.reconcile()
+    assert restarted.current_step == state['current_step']
+    assert restarted.total_quantity == bot.total_quantity
+    # Ордер на продажу переставляется по средней цене после сверки, лестница покупок остается на бирже
+    buys = lambda b: {o['orderId'] for o in b.active_orders if o['side'] == 'BUY'}
+    sells = lambda b: [o['quantity'] for o in b.active_orders if o['side'] == 'SELL']
+    assert buys(restarted) == buys(bot)
+    assert sells(restarted) == sells(bot)
+
+    cycles, _ = run_session(restarted, exchange, path[10000:])
+    assert cycles > 0
+    assert check_invariants(restarted, exchange) == []
+    assert held(exchange) == restarted.total_quantity
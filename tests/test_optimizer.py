@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import optimizer
+from backtest import make_symbol_info
+
+SPACE = {'decline_percent': ['0.5', '1'], 'multiplier': ['1.2', '1.5'], 'max_steps': [3, 5], 'profit_percent': ['0.5']}
+
+
+def write_klines(path, seed, count=2000):
+    rng = random.Random(seed)
+    price = 2.3
+    with open(path, 'w') as f:
+        for i in range(count):
+            price *= 1 + rng.gauss(0, 0.003)
+            f.write(f"{1700000000000 + i * 1000},{price:.4f},{price:.4f},{price:.4f},{price:.4f},1\n")
+
+
+@pytest.fixture
+def sweep(tmp_path):
+    data = tmp_path / 'klines.csv'
+    write_klines(data, seed=1)
+    checkpoint = tmp_path / 'sweep.jsonl'
+    symbol_info = make_symbol_info('XRPUSDT', '0.1', '0.1', '5')
+
+    def run(combos):
+        prices_path, times_path = optimizer.prepare_data(str(data), 'klines', str(tmp_path / 'sweep'))
+        return optimizer.run_sweep(combos, prices_path, times_path, symbol_info, str(checkpoint), workers=1)
+
+    run.checkpoint = checkpoint
+    return run
+
+
+def test_grid_and_random_sampling():
+    grid = list(optimizer.iter_grid(SPACE))
+    assert len(grid) == 8 and len({optimizer.params_key(p) for p in grid}) == 8
+    sample = optimizer.sample_random(SPACE, 5, seed=3)
+    assert sample == optimizer.sample_random(SPACE, 5, seed=3)
+    assert len({optimizer.params_key(p) for p in sample}) == 5
+    assert all(p in grid for p in sample)
+    assert len(optimizer.sample_random(SPACE, 100)) == 8
+
+
+def test_sweep_resumes_from_checkpoint(sweep):
+    combos = list(optimizer.iter_grid(SPACE))
+    first = sweep(combos[:3])
+    assert len(first) == 3
+    ranked = sweep(combos)
+    lines = sweep.checkpoint.read_text().splitlines()
+    # По одной строке на набор: посчитанные ранее наборы не пересчитываются
+    assert len(lines) == len(combos)
+    assert len(ranked) == len(combos)
+    assert [r['score'] for r in ranked] == sorted((r['score'] for r in ranked), reverse=True)
+
+
+def test_truncated_last_line_is_recomputed(sweep):
+    combos = list(optimizer.iter_grid(SPACE))[:2]
+    sweep(combos)
+    text = sweep.checkpoint.read_text()
+    sweep.checkpoint.write_text(text[:-20])  # Прерванная запись последнего результата
+    assert len(sweep(combos)) == 2
@@ -0,0 +1,101 @@
+import decimal
+import itertools
+
+import numpy as np
+
+from backtest import Backtester
+from bot import StrategyConfig, extract_symbol_info
+from simulator import SimulatedExchange, check_invariants, make_bot, mean_reverting_prices, run_session
+
+D = decimal.Decimal
+
+
+def make_exchange(usdt='100000', price='2.3', **kwargs):
+    exchange = SimulatedExchange(balances={'USDT': usdt}, **kwargs)
+    exchange.prices['XRPUSDT'] = D(price)
+    return exchange
+
+
+def prices(count, seed, volatility=0.004, start='2.3'):
+    return list(itertools.islice(mean_reverting_prices(D(start), volatility=volatility, seed=seed), count))
+
+
+def held(exchange, asset='XRP'):
+    return exchange.balances[asset]['free'] + exchange.balances[asset]['locked']
+
+
+def tick(bot, exchange, price):
+    exchange.tick(bot.config.symbol, D(price))
+    closed = bot.process_tick(D(price))
+    exchange.flush_events()
+    return closed
+
+
+# --- Циклы на симуляторе ---
+
+def test_market_cycles():
+    exchange = make_exchange()
+    bot = make_bot(exchange, StrategyConfig())
+    cycles, _ = run_session(bot, exchange, mean_reverting_prices(D('2.3'), seed=1), max_cycles=2000)
+    assert cycles == 2000
+    assert check_invariants(bot, exchange) == []
+    assert held(exchange) == bot.total_quantity
+
+
+def test_limit_cycles_with_partial_fills():
+    exchange = make_exchange(limit_fill_ratio='0.3')
+    bot = make_bot(exchange, StrategyConfig(order_mode='limit', start_price='2.4'))
+    cycles, _ = run_session(bot, exchange, prices(300000, seed=3, volatility=0.002), max_cycles=200)
+    assert cycles == 200
+    assert check_invariants(bot, exchange) == []
+    partial = [o for o in exchange.orders.values() if o['type'] == 'LIMIT' and len(o['fills']) > 1]
+    assert partial, "лимитные ордера должны исполняться частями"
+    assert held(exchange) == bot.total_quantity
+
+
+def test_market_step_retries_after_insufficient_balance():
+    exchange = make_exchange()
+    bot = make_bot(exchange, StrategyConfig(start_price='2.4'))
+    tick(bot, exchange, '2.30')
+    assert bot.current_step == 0 and bot.total_quantity > 0
+    quantity = bot.total_quantity
+    step_price = bot.ladder[0]['price'].quantize(D('0.0001'), rounding=decimal.ROUND_DOWN)
+
+    exchange.inject_error('create_order', -2010, 'Account has insufficient balance for requested action.')
+    tick(bot, exchange, step_price)
+    assert bot.current_step == 0 and bot.total_quantity == quantity
+
+    tick(bot, exchange, step_price)  # Повтор раньше RETRY_DELAY не выполняется
+    assert bot.current_step == 0
+    exchange.clock.advance(5)
+    tick(bot, exchange, step_price)
+    assert bot.current_step == 1 and bot.total_quantity > quantity
+    assert exchange.request_count['create_order'] == 3
+    assert check_invariants(bot, exchange) == []
+
+
+def test_limit_ladder_survives_insufficient_balance():
+    exchange = make_exchange(limit_fill_ratio='0.5')
+    bot = make_bot(exchange, StrategyConfig(order_mode='limit', start_price='2.4'))
+    exchange.inject_error('create_order', -2010, 'Account has insufficient balance for requested action.', count=2)
+    cycles, _ = run_session(bot, exchange, prices(200000, seed=7, volatility=0.002), max_cycles=30)
+    assert cycles == 30
+    assert check_invariants(bot, exchange) == []
+    assert not exchange.open_orders or all(o['orderId'] in {a['orderId'] for a in bot.active_orders}
+                                           for o in exchange.open_orders.values())
+
+
+# --- Бэктест и живая торговля ---
+
+def test_backtest_matches_live_orders():
+    path = prices(50000, seed=11, volatility=0.002)
+    exchange = make_exchange()
+    bot = make_bot(exchange, StrategyConfig())
+    run_session(bot, exchange, path)
+    live = [(t['side'], D(t['qty']), D(t['price'])) for t in exchange.trades]
+
+    symbol_info = extract_symbol_info(exchange.get_exchange_info(), 'XRPUSDT')
+    result = Backtester(StrategyConfig(), symbol_info).run(np.array([float(p) for p in path]))
+    backtest = [(side, quantity, price) for _, side, quantity, price in result.orders]
+    assert len(live) > 100
+    assert live == backtest
@@ -0,0 +1,30 @@
+class UserDataStream:
+    """Поток пользовательских данных Binance (события исполнения ордеров executionReport) через websocket."""
+
+    def __init__(self, callback, api_key=None, api_secret=None, testnet=True):
+        self.callback = callback  # Вызывается для каждого события в потоке websocket-менеджера
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.testnet = testnet
+        self._twm = None
+
+    def start(self):
+        from binance import ThreadedWebsocketManager
+
+        self._twm = ThreadedWebsocketManager(self.api_key, self.api_secret, testnet=self.testnet)
+        self._twm.start()
+        self._twm.start_user_socket(callback=self._handle_message)
+
+    def stop(self):
+        if self._twm is not None:
+            self._twm.stop()
+            self._twm = None
+
+    def _handle_message(self, msg):
+        if msg.get('e') == 'error':
+            print(f"❌ Ошибка потока пользовательских данных: {msg.get('m')}")
+            return
+        try:
+            self.callback(msg)
+        except Exception as e:
+            print(f"❌ Ошибка обработки события ордера: {e}")